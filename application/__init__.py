@@ -1,12 +1,38 @@
 import os
+from contextvars import ContextVar
 
-from flask import Flask
+from flask import Flask, request
+from jinja2 import FileSystemBytecodeCache
 
+DEFAULT_TENANT = "default"
 
-def create_app(test_config=None):
-    app = Flask(__name__, instance_relative_config=True)
+# The tenant (league) whose data is being used. Set for every request from
+# the tenant found by tenants.TenantMiddleware.
+current_tenant = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+
+def create_app(test_config=None, instance_path=None):
+    app = Flask(__name__, instance_path=instance_path,
+                instance_relative_config=True)
     app.config.from_mapping(
-        SECRET_KEY="dev"
+        SECRET_KEY="dev",
+        CLUB_PATH="clubs.json",
+        COMPETITION_PATH="competitions.json",
+        TENANTS={},
+        TENANT_HOSTS={},
+        TENANT_MEMORY_BUDGET=256 * 1024 * 1024,
+        STREAM_TEMPLATES=True,
+        TEMPLATE_BYTECODE_CACHE=True,
+        LIVE_AVAILABILITY=None,
+        SSE_HEARTBEAT_SECONDS=15,
+        SSE_POLL_SECONDS=1,
+        SSE_COALESCE_SECONDS=0.5,
+        WRITER_MAX_BATCH=64,
+        WRITER_MAX_WAIT=0.0,
+        WRITER_RESULT_TIMEOUT=30,
+        SEASON_BASE_GRANT=12,
+        SEASON_CARRY_OVER_CAP=6,
+        SEASON_MIN_ATTENDANCE=4
     )
 
     if test_config is None:
@@ -19,9 +45,52 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    if app.config["LIVE_AVAILABILITY"] is None:
+        # Each SSE connection holds a worker: only cheap with green threads.
+        from .events import green_threads
+        app.config["LIVE_AVAILABILITY"] = green_threads()
+
+    if app.config["TEMPLATE_BYTECODE_CACHE"]:
+        # The compiled templates are kept in the instance folder, so a new
+        # worker doesn't compile them again.
+        bytecode_cache_path = os.path.join(app.instance_path, "jinja_cache")
+        os.makedirs(bytecode_cache_path, exist_ok=True)
+        app.jinja_options = dict(
+            app.jinja_options,
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache_path)
+        )
+
     from . import server
     app.register_blueprint(server.bp)
 
+    from . import tenants
+    app.extensions["gudlft_tenants"] = tenants.TenantRegistry.from_config(
+        app.config, tenants.route_segments(app)
+    )
+    from . import analytics
+    app.extensions["gudlft_analytics"] = analytics.BookingAnalytics()
+    from . import writer
+    app.extensions["gudlft_writer"] = writer.BookingWriter(
+        app.extensions["gudlft_tenants"],
+        app.extensions["gudlft_analytics"],
+        app.config["WRITER_MAX_BATCH"],
+        app.config["WRITER_MAX_WAIT"]
+    )
+    app.wsgi_app = tenants.TenantMiddleware(
+        app.wsgi_app, app.config["TENANTS"], app.config["TENANT_HOSTS"]
+    )
+
+    @app.before_request
+    def set_current_tenant():
+        current_tenant.set(request.environ[tenants.TENANT_ENVIRON_KEY])
+
+    from . import allocation
+    app.cli.add_command(allocation.allocate_points_command)
+
+    from . import reports
+    app.cli.add_command(reports.roster_command)
+    app.cli.add_command(reports.bookings_report_command)
+
     return app
 
 
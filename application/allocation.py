@@ -0,0 +1,170 @@
+"""Season allocation of the clubs' points.
+
+At the start of a season, every club gets:
+    - what is left of its points, up to the carry-over cap,
+    - the base grant,
+    - a refund of the places it reserved at competitions which were cancelled
+      or which took place with fewer booked places than the minimum
+      attendance.
+
+The rules are evaluated on NumPy arrays holding all the clubs at once, and
+the new points are written to the JSON file in a single step.
+
+The command can run while the app is serving. It holds the store.WriteLock of
+the tenant, across processes, from reading the clubs to writing them, so the
+bookings of the app wait for it instead of being overwritten. Then the stores
+of the app see that the JSON file changed and load it again before their next
+booking.
+"""
+
+from typing import Optional
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application import DEFAULT_TENANT, current_tenant
+from application.store import CLUB_FIELDS, RecordTable
+from application.utils import has_taken_place, write_records
+
+
+def reserved_places_entries(clubs: RecordTable, competitions: RecordTable
+                            ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the reservations as three arrays: the position of the club,
+    the position of the competition and the number of places. Only the
+    non-zero reservations are kept, so the arrays stay small whatever the
+    number of competitions. The reserved places at competitions which don't
+    exist anymore are ignored."""
+    columns = {competition["name"]: column
+               for column, competition in enumerate(competitions)}
+    rows, cols, places = [], [], []
+    for row, club in enumerate(clubs):
+        for name, reserved in club["reserved_places"].items():
+            column = columns.get(name)
+            if column is not None and reserved:
+                rows.append(row)
+                cols.append(column)
+                places.append(reserved)
+    return (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp),
+            np.array(places, dtype=np.int64))
+
+
+def refundable_competitions(competitions: RecordTable,
+                            attendance: np.ndarray,
+                            min_attendance: int) -> np.ndarray:
+    """Returns a boolean array telling which competitions are refunded: the
+    cancelled ones, and the ones which took place with less than
+    min_attendance booked places."""
+    count = len(competitions)
+    cancelled = np.fromiter(
+        (bool(competition.get("cancelled")) for competition in competitions),
+        dtype=bool, count=count
+    )
+    took_place = np.fromiter(
+        (has_taken_place(competition) for competition in competitions),
+        dtype=bool, count=count
+    )
+    return cancelled | (took_place & (attendance < min_attendance))
+
+
+def allocate_season_points(clubs: RecordTable,
+                           competitions: RecordTable,
+                           base_grant: int,
+                           carry_over_cap: Optional[int],
+                           min_attendance: int
+                           ) -> tuple[list[dict[str, any]], int]:
+    """Computes the points of every club for the new season.
+
+    Args:
+        clubs: all the clubs, from a store.Snapshot.
+        competitions: all the competitions, from the same snapshot.
+        base_grant: the points every club gets.
+        carry_over_cap: the maximum number of points kept from the last
+            season. None means the clubs keep all their points.
+        min_attendance: the competitions which took place with less booked
+            places than that are refunded.
+
+    Returns: The updated clubs, in the same order, and the total number of
+        refunded points. The refunded reservations are set to 0 so they are
+        never refunded twice.
+    """
+    rows, cols, places = reserved_places_entries(clubs, competitions)
+    attendance = np.bincount(cols, weights=places,
+                             minlength=len(competitions)).astype(np.int64)
+    refundable = refundable_competitions(competitions, attendance,
+                                         min_attendance)
+    points = np.fromiter((int(club["points"]) for club in clubs),
+                         dtype=np.int64, count=len(clubs))
+
+    refunds = np.bincount(rows, weights=places * refundable[cols],
+                          minlength=len(clubs)).astype(np.int64)
+    if carry_over_cap is not None:
+        points = np.minimum(points, carry_over_cap)
+    new_points = points + base_grant + refunds
+
+    refunded_names = [competition["name"] for competition, refunded
+                      in zip(competitions, refundable) if refunded]
+    updated_clubs = []
+    for club, club_points, club_refund in zip(clubs, new_points.tolist(),
+                                              refunds.tolist()):
+        club = dict(club, points=club_points)
+        if club_refund:
+            club["reserved_places"] = dict(
+                club["reserved_places"],
+                **{name: 0 for name in refunded_names
+                   if name in club["reserved_places"]}
+            )
+        updated_clubs.append(club)
+    return updated_clubs, int(refunds.sum())
+
+
+@click.command("allocate-points")
+@click.option("--base-grant", type=int, default=None,
+              help="Points given to every club. "
+                   "Defaults to SEASON_BASE_GRANT.")
+@click.option("--carry-over-cap", type=int, default=None,
+              help="Maximum number of points kept from the last season. "
+                   "Defaults to SEASON_CARRY_OVER_CAP.")
+@click.option("--min-attendance", type=int, default=None,
+              help="Competitions which took place with less booked places "
+                   "are refunded. Defaults to SEASON_MIN_ATTENDANCE.")
+@click.option("--tenant", default=DEFAULT_TENANT,
+              help="The league whose clubs get their points.")
+@click.option("--dry-run", is_flag=True,
+              help="Show the totals without writing the clubs.")
+@with_appcontext
+def allocate_points_command(base_grant, carry_over_cap, min_attendance,
+                            tenant, dry_run):
+    """Allocates the points of the new season to every club.
+
+    The new points are written to the clubs' JSON file, where a running app
+    picks them up.
+    """
+    registry = current_app.extensions["gudlft_tenants"]
+    if tenant not in registry.tenants:
+        raise click.BadParameter(f"unknown tenant {tenant!r}",
+                                 param_hint="--tenant")
+    current_tenant.set(tenant)
+
+    config = current_app.config
+    if base_grant is None:
+        base_grant = config["SEASON_BASE_GRANT"]
+    if carry_over_cap is None:
+        carry_over_cap = config["SEASON_CARRY_OVER_CAP"]
+    if min_attendance is None:
+        min_attendance = config["SEASON_MIN_ATTENDANCE"]
+
+    with registry.writing(tenant) as store:
+        snapshot = store.snapshot()
+        clubs, refunded_points = allocate_season_points(
+            snapshot.clubs, snapshot.competitions,
+            base_grant, carry_over_cap, min_attendance
+        )
+        if not dry_run:
+            write_records(store.club_path, "clubs", clubs)
+            store.publish(RecordTable.from_records(clubs, CLUB_FIELDS),
+                          snapshot.competitions)
+
+    click.echo(f"{len(clubs)} clubs, {sum(club['points'] for club in clubs)}"
+               f" points allocated, {refunded_points} of them refunded.")
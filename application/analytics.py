@@ -0,0 +1,146 @@
+"""Rolling statistics about the bookings.
+
+The places sold at each competition and the failed checks are counted in
+ring buffers of time buckets. Recording an event costs the same whatever the
+uptime, and so does the memory: old buckets are reused instead of piling up.
+"""
+
+import threading
+import time
+from typing import Iterable, Optional
+
+from application import current_tenant
+
+BUCKET_SECONDS = 10
+BUCKETS = 360
+
+
+class RingBuffer:
+    """Counts events in BUCKETS buckets of BUCKET_SECONDS seconds each. A
+    bucket is reset when it's reused for a more recent period."""
+
+    __slots__ = ("_counts", "_periods")
+
+    def __init__(self):
+        self._counts = [0] * BUCKETS
+        self._periods = [-1] * BUCKETS
+
+    def add(self, amount: int, now: float) -> None:
+        period = int(now // BUCKET_SECONDS)
+        slot = period % BUCKETS
+        if self._periods[slot] != period:
+            self._periods[slot] = period
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+
+    def window(self, seconds: int, now: float) -> list[int]:
+        """Returns the counts of the buckets covering the last seconds, from
+        the oldest to the current one."""
+        current_period = int(now // BUCKET_SECONDS)
+        counts = []
+        for period in range(current_period - bucket_count(seconds) + 1,
+                            current_period + 1):
+            slot = period % BUCKETS
+            counts.append(self._counts[slot]
+                          if self._periods[slot] == period else 0)
+        return counts
+
+
+def bucket_count(seconds: int) -> int:
+    """Number of buckets covering the given seconds, at most BUCKETS."""
+    return max(1, min(BUCKETS, -(-seconds // BUCKET_SECONDS)))
+
+
+def percentile(values: list[float], rank: float) -> float:
+    """Nearest-rank percentile of the values, rank being between 0 and 100."""
+    ordered = sorted(values)
+    position = max(0, -(-len(ordered) * rank // 100) - 1)
+    return ordered[int(position)]
+
+
+class BookingAnalytics:
+    """Places sold per competition and failed checks per check, over the last
+    BUCKETS * BUCKET_SECONDS seconds. Each tenant has its own series."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._places_sold = {}
+        self._failed_checks = {}
+
+    def record_booking(self, competition_name: str, places: int,
+                       now: Optional[float] = None) -> None:
+        self._add(self._places_sold, competition_name, places, now)
+
+    def record_failed_check(self, check_name: str,
+                            now: Optional[float] = None) -> None:
+        self._add(self._failed_checks, check_name, 1, now)
+
+    def _add(self, series: dict[tuple[str, str], RingBuffer], name: str,
+             amount: int, now: Optional[float]) -> None:
+        if now is None:
+            now = time.monotonic()
+        key = (current_tenant.get(), name)
+        with self._lock:
+            ring_buffer = series.get(key)
+            if ring_buffer is None:
+                ring_buffer = series[key] = RingBuffer()
+            ring_buffer.add(amount, now)
+
+    def report(self, competitions: Iterable[dict[str, any]], seconds: int,
+               now: Optional[float] = None) -> dict[str, any]:
+        """Summarises the last seconds.
+
+        Args:
+            competitions: the competitions of a store.Snapshot, used to
+                estimate when they will be full.
+            seconds: the size of the window, at most
+                BUCKETS * BUCKET_SECONDS.
+            now: the time.monotonic() value the window ends at.
+
+        Returns: A dictionary holding, for every competition of the current
+            tenant having sold places within the window, the places sold, the
+            rate in places per minute, the median and 95th percentile of the
+            rate over the buckets and the number of seconds before it's full
+            at that rate. It also holds the number and share of each failed
+            check.
+        """
+        if now is None:
+            now = time.monotonic()
+        window_seconds = bucket_count(seconds) * BUCKET_SECONDS
+        tenant = current_tenant.get()
+        with self._lock:
+            places_sold = {name: ring_buffer.window(seconds, now)
+                           for (series_tenant, name), ring_buffer
+                           in self._places_sold.items()
+                           if series_tenant == tenant}
+            failed_checks = {name: sum(ring_buffer.window(seconds, now))
+                             for (series_tenant, name), ring_buffer
+                             in self._failed_checks.items()
+                             if series_tenant == tenant}
+
+        report_competitions = {}
+        for competition in competitions:
+            counts = places_sold.get(competition["name"])
+            if not counts or not any(counts):
+                continue
+            per_minute = [count * 60 / BUCKET_SECONDS for count in counts]
+            rate = sum(counts) * 60 / window_seconds
+            report_competitions[competition["name"]] = {
+                "places_sold": sum(counts),
+                "places_per_minute": rate,
+                "p50_places_per_minute": percentile(per_minute, 50),
+                "p95_places_per_minute": percentile(per_minute, 95),
+                "seconds_until_full":
+                    int(competition["number_of_places"]) * 60 / rate,
+            }
+
+        total_failed_checks = sum(failed_checks.values())
+        return {
+            "window_seconds": window_seconds,
+            "competitions": report_competitions,
+            "failed_checks": {
+                name: {"count": count, "share": count / total_failed_checks}
+                for name, count in failed_checks.items() if count
+            },
+        }
+
@@ -0,0 +1,152 @@
+"""Live availability of the competitions, pushed with server-sent events.
+
+Every published version of a tenant's data notifies its ChangeFeed with the
+names of the competitions which changed. The SSE connections wait on the feed
+without using any CPU, and after a wake-up they wait a little more so a burst
+of bookings gives a single event per competition. Every SSE_POLL_SECONDS, they
+also let the store look for the JSON files changed by other processes.
+
+Each open connection holds a worker of the WSGI server for as long as the page
+is open. That is cheap with a server giving every connection a green thread
+(gevent or eventlet workers, see the README), but a few open pages would take
+all the workers of a pool of sync or threaded workers. So the pages only open
+a connection when LIVE_AVAILABILITY is set, which it is by default when gevent
+or eventlet replaced the threads of the process (see green_threads()).
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+# Versions of the feed kept to tell a listener what changed. A listener which
+# is further behind gets the state of all its competitions again.
+FEED_HISTORY = 1024
+
+
+class ChangeFeed:
+    """Counts the published versions of a tenant's data and remembers which
+    competitions each one changed."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._history = deque(maxlen=FEED_HISTORY)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def notify(self, competition_names: Iterable[str]) -> None:
+        with self._condition:
+            self._version += 1
+            self._history.append((self._version, frozenset(competition_names)))
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """Waits until there is a version more recent than the given one, or
+        until the timeout. Returns the current version."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout)
+            return self._version
+
+    def changes_since(self, version: int) -> tuple[Optional[set[str]], int]:
+        """Returns the names of the competitions changed after the given
+        version, or None if that version is too old to know, and the current
+        version."""
+        with self._condition:
+            if self._history and self._history[0][0] > version + 1:
+                return None, self._version
+            changed = set()
+            for change_version, names in self._history:
+                if change_version > version:
+                    changed |= names
+            return changed, self._version
+
+
+def green_threads() -> bool:
+    """Tells whether gevent or eventlet monkey-patched the threads of the
+    process, as their workers do before loading the app."""
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None \
+            and gevent_monkey.is_module_patched("threading"):
+        return True
+    eventlet_patcher = sys.modules.get("eventlet.patcher")
+    return eventlet_patcher is not None \
+        and eventlet_patcher.is_monkey_patched("thread")
+
+
+def availability_event(competition: dict[str, any], version: int) -> str:
+    data = json.dumps({
+        "name": competition["name"],
+        "number_of_places": competition["number_of_places"],
+        "taken_place": competition.get("taken_place"),
+    })
+    return f"id: {version}\nevent: availability\ndata: {data}\n\n"
+
+
+def availability_events(registry, tenant: str,
+                        competition_names: Optional[set[str]],
+                        since: Optional[int],
+                        heartbeat_seconds: float,
+                        poll_seconds: float,
+                        coalesce_seconds: float) -> Iterator[str]:
+    """Yields the SSE messages telling the client about the number of places
+    and the taken_place field of the competitions.
+
+    Args:
+        registry: the tenants.TenantRegistry of the app.
+        tenant: the tenant whose competitions are watched.
+        competition_names: the watched competitions. None means all of them.
+        since: the version of the feed the client already knows about, from
+            the page it rendered or the id of the last event it got. None
+            means the client gets the state of all the watched competitions
+            first.
+        heartbeat_seconds: an SSE comment is sent after that much time
+            without changes, so proxies keep the connection open.
+        poll_seconds: the longest time between two checks of the JSON
+            files, for the changes made by other processes: the other
+            workers, the allocate-points command or a hand edit.
+        coalesce_seconds: time waited after a change before sending the
+            events, to send the result of a burst of changes only once.
+    """
+    feed = registry.feed(tenant)
+    if since is None or since > feed.version:
+        changed, version = None, feed.version
+    else:
+        changed, version = feed.changes_since(since)
+    sent = {}
+    while True:
+        competitions = registry.store(tenant).snapshot().competitions
+        if changed is None:
+            changed = competition_names
+        elif competition_names is not None:
+            changed &= competition_names
+
+        if changed is None:
+            to_send = iter(competitions)
+        else:
+            to_send = (competitions.get("name", name) for name in changed)
+        for competition in to_send:
+            if competition is None:
+                continue
+            state = (competition["number_of_places"],
+                     competition.get("taken_place"))
+            if sent.get(competition["name"]) != state:
+                sent[competition["name"]] = state
+                yield availability_event(competition, version)
+
+        idle_since = time.monotonic()
+        while True:
+            # The changes made by another process are only seen by the feed
+            # once a snapshot of the store loads the JSON files again.
+            registry.store(tenant).snapshot()
+            if feed.wait(version, poll_seconds) != version:
+                break
+            if time.monotonic() - idle_since >= heartbeat_seconds:
+                yield ": keep-alive\n\n"
+                idle_since = time.monotonic()
+        time.sleep(coalesce_seconds)
+        changed, version = feed.changes_since(version)
@@ -0,0 +1,132 @@
+"""Reports about the bookings, for the organizers of the competitions.
+
+The rows come from the rosters index of a store.Snapshot and are produced
+one at a time, in CSV or JSON Lines, so a report is sent or written while
+it's being built and is never held in memory as a whole.
+"""
+
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application import DEFAULT_TENANT
+from application.store import Snapshot
+
+REPORT_COLUMNS = ("competition", "club", "places")
+# The email of a club is its login, and the HTTP reports have no access
+# control: only the reports of the CLI, run on the server, give it.
+CLI_REPORT_COLUMNS = ("competition", "club", "email", "places")
+REPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+}
+
+
+def roster_rows(snapshot: Snapshot,
+                competition_name: str) -> Iterator[tuple]:
+    """Yields a row for each club having booked places at the competition."""
+    for club_name, places in snapshot.rosters.get(competition_name,
+                                                  {}).items():
+        yield competition_name, club_name, places
+
+
+def booking_rows(snapshot: Snapshot) -> Iterator[tuple]:
+    """Yields the rows of the rosters of all the competitions."""
+    for competition in snapshot.competitions:
+        yield from roster_rows(snapshot, competition["name"])
+
+
+def with_emails(snapshot: Snapshot, rows: Iterable[tuple]) -> Iterator[tuple]:
+    """Adds the email of the club to the rows, for CLI_REPORT_COLUMNS."""
+    for competition_name, club_name, places in rows:
+        yield (competition_name, club_name,
+               snapshot.clubs.get("name", club_name)["email"], places)
+
+
+def csv_lines(rows: Iterable[tuple],
+              columns: tuple[str, ...]) -> Iterator[str]:
+    """Yields the header and the rows as CSV lines."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+    yield buffer.getvalue()
+
+
+def json_lines(rows: Iterable[tuple],
+               columns: tuple[str, ...]) -> Iterator[str]:
+    """Yields the rows as JSON objects, one per line."""
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
+
+
+def report_lines(rows: Iterable[tuple], report_format: str,
+                 columns: tuple[str, ...] = REPORT_COLUMNS) -> Iterator[str]:
+    if report_format == "jsonl":
+        return json_lines(rows, columns)
+    return csv_lines(rows, columns)
+
+
+def echo_report(tenant: str, rows, report_format: str) -> None:
+    """Writes a report to the standard output for the CLI commands, with
+    the emails of the clubs.
+
+    Args:
+        tenant: the tenant whose bookings are reported.
+        rows: a function giving the rows from a snapshot.
+        report_format: one of REPORT_FORMATS.
+    """
+    registry = current_app.extensions["gudlft_tenants"]
+    if tenant not in registry.tenants:
+        raise click.BadParameter(f"unknown tenant {tenant!r}",
+                                 param_hint="--tenant")
+    snapshot = registry.store(tenant).snapshot()
+    for line in report_lines(with_emails(snapshot, rows(snapshot)),
+                             report_format, CLI_REPORT_COLUMNS):
+        click.echo(line, nl=False)
+
+
+report_format_option = click.option(
+    "--format", "report_format", type=click.Choice(list(REPORT_FORMATS)),
+    default="csv", show_default=True
+)
+tenant_option = click.option(
+    "--tenant", default=DEFAULT_TENANT,
+    help="The league whose bookings are reported."
+)
+
+
+@click.command("roster")
+@click.argument("competition_name")
+@report_format_option
+@tenant_option
+@with_appcontext
+def roster_command(competition_name, report_format, tenant):
+    """Lists the clubs having booked places at a competition."""
+    def rows(snapshot):
+        if snapshot.competitions.get("name", competition_name) is None:
+            raise click.BadParameter(
+                f"unknown competition {competition_name!r}",
+                param_hint="COMPETITION_NAME"
+            )
+        return roster_rows(snapshot, competition_name)
+
+    echo_report(tenant, rows, report_format)
+
+
+@click.command("bookings-report")
+@report_format_option
+@tenant_option
+@with_appcontext
+def bookings_report_command(report_format, tenant):
+    """Lists the clubs having booked places at every competition."""
+    echo_report(tenant, booking_rows, report_format)
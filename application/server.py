@@ -5,27 +5,57 @@ or competitions from the JSON files. The keys of those dictionary are
 always strings while the values can be strings, integers, booleans and
 even dictionaries.
 
-Don't change the import names or file paths, they are relative to Project11
-directory; the place from which we run the app.
+Don't change the import names or the file paths in the config, they are
+relative to Project11 directory; the place from which we run the app. The
+data used by a view comes from the store of the tenant (league) being served,
+see tenants.py.
 """
 
-from flask import Blueprint, render_template, \
-    request, redirect, flash, url_for
-from application import load_clubs, search_club, \
-    load_competitions, search_competition, \
-    run_checks, update_all_competitions_taken_place_field, \
-    record_changes
+from concurrent import futures
 
+from flask import Blueprint, render_template, \
+    request, redirect, flash, url_for, jsonify, current_app, Response, abort
+from application import current_tenant
+from application.analytics import BUCKETS, BUCKET_SECONDS
+from application.events import availability_events
+from application.reports import REPORT_FORMATS, report_lines, roster_rows, \
+    booking_rows
+from application.store import quote_segment
+from application.tenants import current_store
+from application.utils import render_page
 
-CLUB_PATH = "clubs.json"
-COMPETITION_PATH = "competitions.json"
 
 bp = Blueprint("gudlft", __name__, url_prefix="")
 
 
+def render_welcome_page(club, snapshot, feed_version, clubs=()):
+    """Renders welcome.html for the club with the competitions of the
+    snapshot.
+
+    The links to the booking pages are made of a prefix, the segments quoted
+    once per competition in the snapshot and the quoted name of the club,
+    instead of calling url_for on each row. The prefix is the URL of a
+    booking page without its two segments.
+    """
+    booking_url_prefix = url_for(
+        "gudlft.book",
+        competition_to_be_booked_name="-",
+        club_making_reservation_name="-"
+    )[:-len("-/-")]
+    return render_page('welcome.html',
+                       club=club,
+                       clubs=clubs,
+                       competitions=snapshot.competitions,
+                       feed_version=feed_version,
+                       booking_url_prefix=booking_url_prefix,
+                       booking_segments=snapshot.booking_segments,
+                       club_segment=quote_segment(club["name"])
+                       if club else "")
+
+
 @bp.route('/')
 def index():
-    clubs = load_clubs(CLUB_PATH)
+    clubs = current_store().snapshot().clubs
     return render_template('index.html',
                            clubs=clubs)
 
@@ -36,11 +66,11 @@ def come_back_welcome_page(email):
     Loads the available competitions in welcome.html and the data about the
     club that was logged_in in booking.html.
     """
-    competitions = load_competitions(COMPETITION_PATH)
-    club, clubs = search_club("email", email, CLUB_PATH)
-    return render_template('welcome.html',
-                           club=club,
-                           competitions=competitions)
+    store = current_store()
+    feed_version = store.feed.version
+    snapshot = store.snapshot()
+    club = snapshot.clubs.get("email", email)
+    return render_welcome_page(club, snapshot, feed_version)
 
 
 @bp.route('/showSummary', methods=['POST'])
@@ -49,16 +79,14 @@ def show_summary():
     Loads the available competitions in welcome.html and the data about the
     club that just logged in in index.html. It handles the form in index.html.
     """
-    club, clubs = search_club("email", request.form['email'], CLUB_PATH)
-    competitions = load_competitions(COMPETITION_PATH)
+    store = current_store()
+    snapshot = store.snapshot()
+    club = snapshot.clubs.get("email", request.form['email'])
     if club:
-        competitions = update_all_competitions_taken_place_field(
-            competitions, COMPETITION_PATH
-        )
-        return render_template('welcome.html',
-                               club=club,
-                               clubs=clubs,
-                               competitions=competitions)
+        feed_version = store.feed.version
+        snapshot = store.refresh_taken_place()
+        return render_welcome_page(club, snapshot, feed_version,
+                                   clubs=snapshot.clubs)
 
     flash("we couldn't find your email in our database.")
     return render_template("index.html")
@@ -77,17 +105,11 @@ def book(competition_to_be_booked_name, club_making_reservation_name):
     book a place at that competition, the flash message will them that something
     went wrong. But I don't see any reason for that to happen. The user never
     manually enters a competition's name.
-    Ideally, I shouldn't even have to reload the JSON file. But for the moment
-    it seems I can only send a str repr of a dict and not a dict through url_for.
-    In other words, the value passed to competition_to_be_booked isn't a dict
-    but a str repr of a dict or a dict.
     """
-    competition, competitions = search_competition(
-        "name",
-        competition_to_be_booked_name,
-        COMPETITION_PATH
-    )
-    club, clubs = search_club("name", club_making_reservation_name, CLUB_PATH)
+    snapshot = current_store().snapshot()
+    competition = snapshot.competitions.get("name",
+                                            competition_to_be_booked_name)
+    club = snapshot.clubs.get("name", club_making_reservation_name)
     return render_template('booking.html',
                            club=club,
                            competition=competition)
@@ -95,38 +117,115 @@ def book(competition_to_be_booked_name, club_making_reservation_name):
 
 @bp.route('/purchasePlaces', methods=['POST'])
 def purchase_places():
-    """Handles the form in booking.html."""
+    """Handles the form in booking.html.
 
-    competition_to_be_booked_name = request.form['competition']
-    competition, competitions = search_competition(
-        "name",
-        competition_to_be_booked_name,
-        COMPETITION_PATH
-    )
-    club, clubs = search_club("name", request.form["club"], CLUB_PATH)
-    places_required = int(request.form['places'])
-    club_number_of_points = int(club["points"])
+    The booking is checked and recorded by the app's writer.BookingWriter,
+    one at a time, on the latest version of the data. That way, two bookings
+    can't both spend the same points or places.
 
-    failed_checks = run_checks(competition, club, places_required,
-                               club_number_of_points)
-    if failed_checks:
-        return failed_checks
+    If the writer doesn't answer within WRITER_RESULT_TIMEOUT seconds, the
+    user gets an error page. The booking may still be committed later.
+    """
+    places_required = int(request.form['places'])
+    future = current_app.extensions["gudlft_writer"].submit(
+        current_tenant.get(),
+        request.form['competition'],
+        request.form["club"],
+        places_required
+    )
+    try:
+        result = future.result(
+            timeout=current_app.config["WRITER_RESULT_TIMEOUT"]
+        )
+    except futures.TimeoutError:
+        abort(503, description="Your booking could not be confirmed in "
+                               "time. Please check your points before "
+                               "trying again.")
+    if result.failed_check:
+        flash(result.failed_check)
+        return render_template("booking.html",
+                               club=result.club,
+                               competition=result.competition)
 
-    competitions, club = record_changes(competitions, competition, clubs, club,
-                                        places_required, club_number_of_points,
-                                        COMPETITION_PATH, CLUB_PATH)
     flash('Great-booking complete!')
-    return render_template('welcome.html',
-                           club=club,
-                           clubs=clubs,
-                           competitions=competitions)
+    return render_welcome_page(result.club, result.snapshot,
+                               result.feed_version,
+                               clubs=result.snapshot.clubs)
 
 
 @bp.route("/points")
 def points():
-    clubs_to_display = load_clubs(CLUB_PATH)
-    return render_template("points.html",
-                           clubs=clubs_to_display)
+    clubs_to_display = current_store().snapshot().clubs
+    return render_page("points.html",
+                       clubs=clubs_to_display)
+
+
+@bp.route("/analytics")
+def analytics():
+    """Booking velocity per competition and share of each failed check over
+    the last `window` seconds (an hour by default)."""
+    seconds = request.args.get("window", BUCKETS * BUCKET_SECONDS, type=int)
+    competitions = current_store().snapshot().competitions
+    return jsonify(current_app.extensions["gudlft_analytics"].report(
+        competitions, seconds
+    ))
+
+
+@bp.route("/availability")
+def availability():
+    """Server-sent events telling the number of places left and whether the
+    competitions took place, each time it changes. The watched competitions
+    are given by the `competition` query parameters; all of them if there
+    are none.
+
+    A client which reconnects, or which gives the feed version of the page it
+    rendered as `since`, only gets what changed after it.
+
+    Not found unless LIVE_AVAILABILITY is set, see events.py."""
+    if not current_app.config["LIVE_AVAILABILITY"]:
+        abort(404)
+    competition_names = set(request.args.getlist("competition")) or None
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    events = availability_events(
+        current_app.extensions["gudlft_tenants"],
+        current_tenant.get(),
+        competition_names,
+        int(since) if since and since.isdigit() else None,
+        current_app.config["SSE_HEARTBEAT_SECONDS"],
+        current_app.config["SSE_POLL_SECONDS"],
+        current_app.config["SSE_COALESCE_SECONDS"]
+    )
+    return Response(events, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@bp.route("/reports/roster/<competition_name>")
+def roster_report(competition_name):
+    """Streams the clubs having booked places at the competition, in the
+    `format` given in the query string: csv (the default) or jsonl."""
+    report_format = request.args.get("format", "csv")
+    snapshot = current_store().snapshot()
+    if report_format not in REPORT_FORMATS or \
+            snapshot.competitions.get("name", competition_name) is None:
+        abort(404)
+    return Response(
+        report_lines(roster_rows(snapshot, competition_name), report_format),
+        mimetype=REPORT_FORMATS[report_format]
+    )
+
+
+@bp.route("/reports/bookings")
+def bookings_report():
+    """Streams the clubs having booked places at every competition, in the
+    `format` given in the query string: csv (the default) or jsonl."""
+    report_format = request.args.get("format", "csv")
+    if report_format not in REPORT_FORMATS:
+        abort(404)
+    return Response(
+        report_lines(booking_rows(current_store().snapshot()), report_format),
+        mimetype=REPORT_FORMATS[report_format]
+    )
 
 
 @bp.route('/logout')
@@ -136,4 +235,3 @@ def logout():
 
 def just_to_see():
     return
-
@@ -0,0 +1,373 @@
+"""In-memory versions of the clubs and competitions.
+
+The JSON files are read when first needed. Then every committed change
+publishes a new Snapshot by swapping a single reference. A snapshot is never
+modified after being published, so a request can grab the current one without
+any lock and render from it consistently while bookings go on.
+
+The files can also be changed outside of the store: by another worker, by the
+allocate-points command or by hand. The store compares their os.stat with the
+one it loaded or last wrote each time a snapshot is asked for, and loads them
+again if they differ.
+
+Publishing a new version doesn't copy all the clubs. The records are kept in
+small chunks; only the records that changed and the chunks holding them are
+copied, everything else is shared with the previous versions.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Optional
+
+from werkzeug.routing import BaseConverter, Map
+
+from application.events import ChangeFeed
+from application.utils import load_clubs, load_competitions, \
+    update_all_competitions_taken_place_field, has_taken_place
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CHUNK_SIZE = 256
+CLUB_FIELDS = ("name", "email")
+COMPETITION_FIELDS = ("name",)
+
+
+class RecordTable:
+    """An immutable sequence of records (clubs or competitions) which can be
+    looked up by some of their fields.
+
+    The first indexed field is the primary key used by replace(). The values
+    of the indexed fields must not change from one version of a record to the
+    next; that way the indexes are shared by all the versions of the table.
+    """
+
+    __slots__ = ("_chunks", "_indexes", "_length")
+
+    def __init__(self, chunks: tuple, indexes: dict[str, dict[any, int]],
+                 length: int):
+        self._chunks = chunks
+        self._indexes = indexes
+        self._length = length
+
+    @classmethod
+    def from_records(cls, records: list[dict[str, any]],
+                     fields: tuple[str, ...]) -> "RecordTable":
+        """Builds a table from the records loaded from a JSON file. If two
+        records share the value of an indexed field, the first one wins, like
+        in utils.search_club."""
+        indexes = {field: {} for field in fields}
+        for position, record in enumerate(records):
+            for field, index in indexes.items():
+                index.setdefault(record[field], position)
+        chunks = tuple(tuple(records[start:start + CHUNK_SIZE])
+                       for start in range(0, len(records), CHUNK_SIZE))
+        return cls(chunks, indexes, len(records))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[dict[str, any]]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def get(self, field: str, value: any) -> Optional[dict[str, any]]:
+        """Returns the record having the corresponding value for an indexed
+        field, or None."""
+        position = self._indexes[field].get(value)
+        if position is None:
+            return None
+        return self._chunks[position // CHUNK_SIZE][position % CHUNK_SIZE]
+
+    def replace(self, *records: dict[str, any]) -> "RecordTable":
+        """Returns a new table where the records having the same primary key
+        as the given records are replaced by them. The untouched chunks are
+        shared with this table."""
+        primary_index = next(iter(self._indexes.values()))
+        primary_field = next(iter(self._indexes))
+        chunks = list(self._chunks)
+        copied = {}
+        for record in records:
+            position = primary_index[record[primary_field]]
+            chunk_number, offset = divmod(position, CHUNK_SIZE)
+            if chunk_number not in copied:
+                copied[chunk_number] = list(chunks[chunk_number])
+            copied[chunk_number][offset] = record
+        for chunk_number, chunk in copied.items():
+            chunks[chunk_number] = tuple(chunk)
+        return RecordTable(tuple(chunks), self._indexes, self._length)
+
+    def changed_records(self, previous: "RecordTable"
+                        ) -> Iterator[dict[str, any]]:
+        """Yields the records of this table which aren't in the previous
+        version of it. Thanks to the shared chunks, only the chunks which
+        were copied are looked at."""
+        if self._indexes is not previous._indexes:
+            yield from self
+            return
+        for chunk, previous_chunk in zip(self._chunks, previous._chunks):
+            if chunk is not previous_chunk:
+                for record, previous_record in zip(chunk, previous_chunk):
+                    if record is not previous_record:
+                        yield record
+
+
+def build_rosters(clubs: RecordTable) -> dict[str, dict[str, int]]:
+    """Builds the index giving, for each competition, the number of places
+    reserved by each club having reserved some."""
+    rosters = {}
+    for club in clubs:
+        for competition_name, places in club["reserved_places"].items():
+            if places:
+                rosters.setdefault(competition_name, {})[club["name"]] = places
+    return rosters
+
+
+def update_rosters(rosters: dict[str, dict[str, int]], clubs: RecordTable,
+                   previous_clubs: RecordTable) -> dict[str, dict[str, int]]:
+    """Returns the rosters of the new version of the clubs. Only the rosters
+    of the competitions whose reservations changed are copied; the others
+    are shared with the previous version."""
+    changes = {}
+    for club in clubs.changed_records(previous_clubs):
+        previous_club = previous_clubs.get("name", club["name"])
+        previous_reserved_places = \
+            previous_club["reserved_places"] if previous_club else {}
+        for competition_name in club["reserved_places"].keys() \
+                | previous_reserved_places.keys():
+            places = club["reserved_places"].get(competition_name, 0)
+            if places != previous_reserved_places.get(competition_name, 0):
+                changes.setdefault(competition_name, {})[club["name"]] = places
+    if not changes:
+        return rosters
+
+    rosters = dict(rosters)
+    for competition_name, changed_places in changes.items():
+        roster = dict(rosters.get(competition_name, {}))
+        for club_name, places in changed_places.items():
+            if places:
+                roster[club_name] = places
+            else:
+                roster.pop(club_name, None)
+        rosters[competition_name] = roster
+    return rosters
+
+
+# Quotes a value for a path segment exactly like url_for() does for the
+# default converter of the routes.
+quote_segment = BaseConverter(Map()).to_url
+
+
+def build_booking_segments(competitions: RecordTable) -> dict[str, str]:
+    """Quotes the name of each competition for the URLs of its booking page,
+    once instead of on each row of each welcome.html."""
+    return {competition["name"]: quote_segment(competition["name"])
+            for competition in competitions}
+
+
+class Snapshot(NamedTuple):
+    """One committed version of the clubs and competitions.
+
+    rosters is an index of the clubs' reserved_places by competition, so the
+    bookings of a competition can be listed without looking at every club.
+    booking_segments gives the URL path segment of each competition; the
+    names of the competitions never change, so it's shared by all versions.
+    """
+    version: int
+    clubs: RecordTable
+    competitions: RecordTable
+    rosters: dict[str, dict[str, int]]
+    booking_segments: dict[str, str]
+
+
+def file_stats(*paths: str) -> tuple[tuple[int, int, int], ...]:
+    """Tells whether files were replaced or modified: their modification
+    time, size and inode."""
+    stats = []
+    for path in paths:
+        stat = os.stat(path)
+        stats.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+    return tuple(stats)
+
+
+class WriteLock:
+    """Serialises the writers of a pair of JSON files.
+
+    Within the process, it's a reentrant lock. Across processes, the
+    outermost acquisition also takes an fcntl.flock on a lock file next to
+    the JSON files, so the booking writers of every worker and the
+    allocate-points command never write on top of each other. Without fcntl
+    (on Windows), only the writers of the process are serialised.
+
+    thread_lock is the lock within the process alone, for the readers which
+    load the files again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self) -> "WriteLock":
+        self.thread_lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                lock_file = open(self.path, "a")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except BaseException:
+                    lock_file.close()
+                    raise
+                self._file = lock_file
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # Closing the file releases the flock.
+            self._file.close()
+            self._file = None
+        self.thread_lock.release()
+
+
+def lock_path(club_path: str) -> str:
+    return f"{club_path}.lock"
+
+
+class DataStore:
+    """Holds the current Snapshot of the data stored in two JSON files.
+
+    Readers call snapshot() once per request and never wait on the writers,
+    except for the first load of the files. When the JSON files were changed
+    outside of the store, the reader which sees it loads them again, unless a
+    writer holds the lock; then it keeps the current version. Writers hold
+    writing() while they read the current snapshot, persist their changes and
+    publish() the new version, so two bookings can't be built on the same
+    version. The lock of writing() is a WriteLock, held across processes, and
+    snapshot() loads the files changed by another process again within it,
+    so a writer always builds on the latest files.
+
+    Every published version notifies the feed with the names of the
+    competitions which changed, including the versions loaded again after the
+    files were changed outside of the store.
+
+    A store is retired when tenants.TenantRegistry drops it. Requests which
+    already have it can keep reading from it, but it doesn't write anymore:
+    the JSON files may already have been loaded and changed by its
+    replacement.
+    """
+
+    def __init__(self, club_path: str, competition_path: str,
+                 write_lock: Optional[WriteLock] = None,
+                 feed: Optional[ChangeFeed] = None):
+        self.club_path = club_path
+        self.competition_path = competition_path
+        self.feed = feed or ChangeFeed()
+        self.retired = False
+        self._write_lock = write_lock or WriteLock(lock_path(club_path))
+        self._snapshot = None
+        self._file_stats = None
+
+    def snapshot(self) -> Snapshot:
+        """Returns the current version, loading the JSON files the first
+        time or if they were changed outside of the store."""
+        snapshot = self._snapshot
+        if snapshot is None or self._files_changed():
+            # While a writer holds the lock, the files may be half way
+            # through its commit: the current version is returned instead
+            # of waiting for it. Only the first load waits.
+            thread_lock = self._write_lock.thread_lock
+            if not thread_lock.acquire(blocking=snapshot is None):
+                return snapshot
+            try:
+                if self._snapshot is None or self._files_changed():
+                    self._load()
+                snapshot = self._snapshot
+            finally:
+                thread_lock.release()
+        return snapshot
+
+    def _files_changed(self) -> bool:
+        return file_stats(self.club_path,
+                          self.competition_path) != self._file_stats
+
+    def _load(self) -> None:
+        """Reads the JSON files into a new version. The files are looked at
+        before being read, so a change made while reading them is seen by the
+        next call to snapshot()."""
+        stats = file_stats(self.club_path, self.competition_path)
+        clubs = RecordTable.from_records(load_clubs(self.club_path),
+                                         CLUB_FIELDS)
+        competitions = RecordTable.from_records(
+            load_competitions(self.competition_path), COMPETITION_FIELDS
+        )
+        previous = self._snapshot
+        self._snapshot = Snapshot(
+            previous.version + 1 if previous else 0,
+            clubs,
+            competitions,
+            build_rosters(clubs),
+            build_booking_segments(competitions)
+        )
+        self._file_stats = stats
+        if previous is not None:
+            self.feed.notify(
+                competition["name"] for competition in competitions
+                if previous.competitions.get("name", competition["name"])
+                != competition
+            )
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """Serialises the writers. Readers only wait on it to load the JSON
+        files the first time."""
+        with self._write_lock:
+            yield
+
+    def publish(self, clubs: RecordTable,
+                competitions: RecordTable) -> Snapshot:
+        """Makes the given tables the current version, with their rosters.
+        Must be called within writing(), after the changes were written to
+        the JSON files and built on the snapshot() taken within it."""
+        previous = self._snapshot
+        rosters = previous.rosters
+        if clubs is not previous.clubs:
+            rosters = update_rosters(rosters, clubs, previous.clubs)
+        snapshot = Snapshot(previous.version + 1, clubs, competitions,
+                            rosters, previous.booking_segments)
+        self._snapshot = snapshot
+        self._file_stats = file_stats(self.club_path, self.competition_path)
+        if competitions is not previous.competitions:
+            self.feed.notify(
+                competition["name"] for competition
+                in competitions.changed_records(previous.competitions)
+            )
+        return snapshot
+
+    def refresh_taken_place(self) -> Snapshot:
+        """Publishes a new version if the taken_place field of some
+        competitions is out of date. Most of the time, nothing changed and
+        the current version is returned without waiting on the writers."""
+        snapshot = self.snapshot()
+        if all(has_taken_place(competition) == competition.get("taken_place")
+               for competition in snapshot.competitions):
+            return snapshot
+
+        with self.writing():
+            snapshot = self.snapshot()
+            if self.retired:
+                return snapshot
+            competitions = update_all_competitions_taken_place_field(
+                snapshot.competitions, self.competition_path
+            )
+            if competitions is snapshot.competitions:
+                return snapshot
+            return self.publish(snapshot.clubs, competitions)
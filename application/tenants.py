@@ -0,0 +1,171 @@
+"""Several leagues, each with its own clubs and competitions, served by the
+same app.
+
+A request is routed to a league (a tenant) by its host (TENANT_HOSTS) or by
+the first segment of its path (/<tenant>/...). Otherwise, it goes to the
+default tenant, whose JSON files are CLUB_PATH and COMPETITION_PATH.
+
+The data of a tenant is only loaded when it's first used. When the estimated
+memory used by the loaded tenants goes over TENANT_MEMORY_BUDGET, the least
+recently used ones are dropped; they will be loaded again from their JSON
+files when needed.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from flask import current_app
+
+from application import DEFAULT_TENANT, current_tenant
+from application.events import ChangeFeed
+from application.store import DataStore, WriteLock, lock_path
+
+TENANT_ENVIRON_KEY = "gudlft.tenant"
+
+# Rough ratio between the memory used by the loaded records and the size of
+# their JSON files (about 2.7 for 50k clubs in compact JSON; the indented
+# files written by the app make it an overestimate).
+RESIDENCY_FACTOR = 3
+
+
+class TenantMiddleware:
+    """WSGI middleware finding the tenant of a request. When the tenant comes
+    from the path, its segment is moved to SCRIPT_NAME so the routes and
+    url_for() work the same for every tenant."""
+
+    def __init__(self, wsgi_app, tenants: Iterable[str],
+                 hosts: dict[str, str]):
+        self.wsgi_app = wsgi_app
+        self.tenants = frozenset(tenants)
+        self.hosts = hosts
+
+    def __call__(self, environ, start_response):
+        host = environ.get("HTTP_HOST", "").partition(":")[0]
+        tenant = self.hosts.get(host)
+        if tenant is None:
+            segment, _, rest = environ.get(
+                "PATH_INFO", ""
+            ).lstrip("/").partition("/")
+            if segment in self.tenants:
+                tenant = segment
+                environ["SCRIPT_NAME"] = \
+                    environ.get("SCRIPT_NAME", "") + "/" + segment
+                environ["PATH_INFO"] = "/" + rest
+        environ[TENANT_ENVIRON_KEY] = tenant or DEFAULT_TENANT
+        return self.wsgi_app(environ, start_response)
+
+
+class TenantRegistry:
+    """Keeps the DataStore of the recently used tenants.
+
+    Every tenant has a ChangeFeed and a write lock which outlive its stores.
+    The feed keeps the clients of events.availability_events listening
+    through a reload. A store is only loaded while holding the write lock,
+    and writers get their store from writing(), so a writer always builds on
+    the latest data even if the store it was given by a former request was
+    dropped and loaded again since.
+    """
+
+    def __init__(self, tenants: dict[str, dict[str, str]],
+                 memory_budget: int):
+        self.tenants = tenants
+        self.memory_budget = memory_budget
+        self._lock = threading.Lock()
+        self._write_locks = {
+            tenant: WriteLock(lock_path(paths["CLUB_PATH"]))
+            for tenant, paths in tenants.items()
+        }
+        self._feeds = {tenant: ChangeFeed() for tenant in tenants}
+        self._resident = OrderedDict()
+        self._resident_size = 0
+
+    @classmethod
+    def from_config(cls, config,
+                    route_segments: Iterable[str] = ()) -> "TenantRegistry":
+        """Builds the registry of the TENANTS of the config, plus the default
+        tenant.
+
+        Args:
+            config: the config of the app.
+            route_segments: the first segments of the paths of the app's
+                routes. A tenant can't be named like one of them, since
+                TenantMiddleware would take the route for the tenant.
+
+        Raises:
+            ValueError: if a tenant is named like a route or like the
+                default tenant, or if TENANT_HOSTS maps a host to an unknown
+                tenant.
+        """
+        route_segments = set(route_segments)
+        for tenant in config["TENANTS"]:
+            if tenant == DEFAULT_TENANT or tenant in route_segments:
+                raise ValueError(
+                    f"the tenant name {tenant!r} is reserved by the app"
+                )
+        for host, tenant in config["TENANT_HOSTS"].items():
+            if tenant != DEFAULT_TENANT and tenant not in config["TENANTS"]:
+                raise ValueError(
+                    f"TENANT_HOSTS maps {host!r} to the unknown tenant "
+                    f"{tenant!r}"
+                )
+
+        tenants = dict(config["TENANTS"])
+        tenants[DEFAULT_TENANT] = {
+            "CLUB_PATH": config["CLUB_PATH"],
+            "COMPETITION_PATH": config["COMPETITION_PATH"],
+        }
+        return cls(tenants, config["TENANT_MEMORY_BUDGET"])
+
+    def store(self, tenant: str) -> DataStore:
+        """Returns the store of the tenant, creating it if it was never used
+        or was dropped. Drops the least recently used stores if needed."""
+        with self._lock:
+            resident = self._resident.get(tenant)
+            if resident is not None:
+                self._resident.move_to_end(tenant)
+                return resident[0]
+
+            paths = self.tenants[tenant]
+            store = DataStore(paths["CLUB_PATH"], paths["COMPETITION_PATH"],
+                              self._write_locks[tenant], self._feeds[tenant])
+            size = RESIDENCY_FACTOR * (
+                os.path.getsize(store.club_path)
+                + os.path.getsize(store.competition_path)
+            )
+            self._resident[tenant] = (store, size)
+            self._resident_size += size
+            while self._resident_size > self.memory_budget \
+                    and len(self._resident) > 1:
+                _, (evicted_store, evicted_size) = \
+                    self._resident.popitem(last=False)
+                evicted_store.retired = True
+                self._resident_size -= evicted_size
+            return store
+
+    def feed(self, tenant: str) -> ChangeFeed:
+        return self._feeds[tenant]
+
+    @contextmanager
+    def writing(self, tenant: str) -> Iterator[DataStore]:
+        """Holds the write lock of the tenant and gives its current store."""
+        with self._write_locks[tenant]:
+            store = self.store(tenant)
+            with store.writing():
+                yield store
+
+
+def route_segments(app) -> set[str]:
+    """The first segments of the paths of the app's routes."""
+    return {rule.rule.lstrip("/").partition("/")[0]
+            for rule in app.url_map.iter_rules()}
+
+
+def current_store() -> DataStore:
+    """The store of the tenant being served."""
+    return current_app.extensions["gudlft_tenants"].store(
+        current_tenant.get()
+    )
+
@@ -6,10 +6,20 @@ even dictionaries.
 """
 
 import json
+import os
+import shutil
+import tempfile
 from datetime import datetime
 from typing import Union
 
-from flask import flash, render_template
+from flask import Response, current_app, get_flashed_messages, \
+    render_template, stream_with_context
+
+
+# Number of Jinja output chunks gathered before a piece of a streamed page is
+# handed to the WSGI server. One chunk per write would mean one syscall per
+# template statement.
+STREAM_BUFFER_SIZE = 64
 
 
 def load_clubs(path) -> list[dict[str, any]]:
@@ -28,6 +38,41 @@ def load_competitions(path) -> list[dict[str, any]]:
         return list_of_competitions
 
 
+def write_records(path: str, key: str, records) -> None:
+    """Writes the clubs or competitions back to their JSON file, under the
+    given key ("clubs" or "competitions").
+
+    The records are written to a temporary file of the same directory, which
+    is synced to the disk and then renamed. The directory is synced too, so
+    the JSON file is never seen half written and the new version is still
+    there after a crash. Each writer gets its own temporary file, so
+    processes writing the same JSON file don't rename each other's."""
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(file_descriptor, "w") as file_to_write:
+            json.dump({key: list(records)},
+                      file_to_write,
+                      indent=4)
+            file_to_write.flush()
+            os.fsync(file_to_write.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    directory_descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_descriptor)
+    finally:
+        os.close(directory_descriptor)
+
+
 def search_club(field: str, value: any, path: str) -> Union[list, tuple[
     dict[str, any], list[dict[str, any]]]]:
     """Loads the JSON file containing data about the clubs and
@@ -63,33 +108,70 @@ def search_competition(field: str, value: any, path: str) -> Union[list, tuple[
         return competition, competitions
 
 
+def has_taken_place(competition: dict[str, any]) -> bool:
+    """Compares the date field of the competition with datetime.now()."""
+    return datetime.strptime(
+        competition["date"], "%Y-%m-%d %H:%M:%S"
+    ) <= datetime.now()
+
+
 def update_all_competitions_taken_place_field(
-        competitions: list[dict[str, any]],
-        competition_path: str) -> list[dict[str, any]]:
-    """Receives a list of competitions. Loops through each
+        competitions: "RecordTable",
+        competition_path: str) -> "RecordTable":
+    """Receives the competitions of a store.Snapshot. Loops through each
     competition. Compares the date field with datetime.now(). Sets
     the taken_place field to True if the date field is behind.
-    Writes the list of competitions to the JSON file and returns
-    the list."""
-    for competition in competitions:
-        if datetime.strptime(
-                competition["date"], "%Y-%m-%d %H:%M:%S"
-        ) <= datetime.now():
-            competition["taken_place"] = True
-        else:
-            competition["taken_place"] = False
-            with open(
-                    competition_path, "w"
-            ) as file_to_write_competitions:
-                json.dump({"competitions": competitions},
-                          file_to_write_competitions,
-                          indent=4)
+
+    The competitions of a snapshot are shared between requests and never
+    modified: the competitions whose field changed are copied. If any,
+    writes the competitions to the JSON file and returns a new table.
+    Otherwise, returns the same table."""
+    updated_competitions = [
+        dict(competition, taken_place=has_taken_place(competition))
+        for competition in competitions
+        if has_taken_place(competition) != competition.get("taken_place")
+    ]
+    if not updated_competitions:
+        return competitions
+
+    competitions = competitions.replace(*updated_competitions)
+    write_records(competition_path, "competitions", competitions)
     return competitions
 
 
+def render_page(template_name: str, **context) -> Union[str, Response]:
+    """Renders a template like render_template does, but streams it to the
+    client while it's being rendered if STREAM_TEMPLATES is set in the config.
+
+    With big lists of clubs or competitions, the client gets the beginning of
+    the page while Jinja is still looping and the whole page never sits in
+    memory as a single string.
+
+    The flashed messages are popped before the response is sent. Otherwise,
+    they would be popped by the template after the session cookie was
+    written and the next page would show them again.
+
+    Args:
+        template_name: the name of the template in the templates directory.
+        **context: the variables made available in the template.
+
+    Returns: The rendered page or a streamed response.
+    """
+    if not current_app.config.get("STREAM_TEMPLATES"):
+        return render_template(template_name, **context)
+
+    get_flashed_messages()
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream))
+
+
 def more_than_12_reserved_places(club_reserved_places: int,
                                  required_places: int) -> Union[str, None]:
-    """Flashes a message if the club did reserve more than 12 places.
+    """Checks if the club would reserve more than 12 places.
 
     Args:
         club_reserved_places: the number of places the club already reserved at
@@ -97,19 +179,18 @@ def more_than_12_reserved_places(club_reserved_places: int,
         required_places: the number of places the club wants to reserve at the
             tournament within this operation.
 
-    Returns: A string used in run_checks() if the club tries to reserve more
-        than 12 places.
+    Returns: The message flashed by server.purchase_places() if the club tries
+        to reserve more than 12 places.
     """
     to_be_reserved_total_places = club_reserved_places + required_places
     if to_be_reserved_total_places > 12:
-        flash("you required more than 12 places !")
-        return "failed_check"
+        return "you required more than 12 places !"
 
 
 def not_enough_points(required_places: int, club_number_of_points: int) -> \
         Union[str, None]:
-    """Flashes the corresponding message if the club wants to purchase more
-    places than they have points.
+    """Checks if the club wants to purchase more places than they have
+    points.
 
     Args:
         required_places: the number of places the club wants to reserve at the
@@ -117,34 +198,32 @@ def not_enough_points(required_places: int, club_number_of_points: int) -> \
         club_number_of_points: the number of points the club has before this
             operation.
 
-    Returns: A string used in run_checks() if the club wants to purchase more
-    places than they have points.
+    Returns: The message flashed by server.purchase_places() if the club wants
+    to purchase more places than they have points.
     """
     if required_places > club_number_of_points:
-        flash("you do not have enough points!")
-        return "failed_check"
+        return "you do not have enough points!"
 
 
 def no_more_available_places(required_places: int, places_available: int) -> \
         Union[str, None]:
-    """Flashes the corresponding message if there aren't enough places at the
-    competition.
+    """Checks if there aren't enough places at the competition.
 
     Args:
         required_places: the number of places the club wants to reserve at the
             tournament within this operation.
         places_available: the competition's number of available places.
 
-    Returns: A string used in run_checks() if the club wants to purchase
-        places although the competition doesn't have places anymore.
+    Returns: The message flashed by server.purchase_places() if the club wants
+        to purchase places although the competition doesn't have places
+        anymore.
     """
     if places_available - required_places < 0:
-        flash("there are no more places available !")
-        return "failed_check"
+        return "there are no more places available !"
 
 
 def competition_took_place(competition: dict[str, any]) -> Union[str, None]:
-    """Flashes the corresponding message if the competition already took place.
+    """Checks if the competition already took place.
 
     There is already a check when welcome.html is loaded. However, it might be
     the case that after first loading the page, the user is inactive some time
@@ -155,28 +234,23 @@ def competition_took_place(competition: dict[str, any]) -> Union[str, None]:
         competition: the competition where the club wants to reserve a place
             within this operation.
 
-    Returns: A string used in run_checks() if the club wants to purchase
-        places although the competition already took place.
+    Returns: The message flashed by server.purchase_places() if the club wants
+        to purchase places although the competition already took place.
     """
-    if datetime.strptime(
-            competition["date"], "%Y-%m-%d %H:%M:%S"
-    ) <= datetime.now():
-        competition["taken_place"] = True
-    else:
-        competition["taken_place"] = False
-    if competition["taken_place"]:
-        flash("the competition already took place !")
-        return "failed_check"
+    if has_taken_place(competition):
+        return "the competition already took place !"
 
 
-def run_checks(competition: dict[str, any], club: dict[str, any],
-               required_places: int, club_number_of_points: int) -> callable:
+def first_failed_check(competition: dict[str, any], club: dict[str, any],
+                       required_places: int,
+                       club_number_of_points: int
+                       ) -> Union[tuple[str, str], None]:
     """Makes sure all conditions are met to enable the club to purchase the
     required places at the competition.
 
-    The first unmet condition will trigger a flash message via one of the
-    4 functions call. Each function calls checks one condition. If one checks
-    failed, the following checks aren't done.
+    Each of the 4 functions called checks one condition. If one check failed,
+    the following checks aren't done. Doesn't need a request, so the
+    writer.BookingWriter thread can use it.
 
     Args:
         competition: the competition where the club wants to purchase places
@@ -187,80 +261,66 @@ def run_checks(competition: dict[str, any], club: dict[str, any],
         club_number_of_points: the number of points the club has before this
             operation.
 
-    Returns: A call to render_template. It renders booking.html from the
-        templates directory with the club and competition vars as a context.
+    Returns: The name of the function of the first unmet condition, which
+        the analytics count the failures by, and its message, if any.
     """
-
-    failed_checks = more_than_12_reserved_places(
-        club["reserved_places"][competition["name"]],
-        required_places
-    ) or not_enough_points(
-        required_places,
-        club_number_of_points
-    ) or no_more_available_places(
-        required_places,
-        competition["number_of_places"]
-    ) or competition_took_place(competition)
-
-    if failed_checks:
-        return render_template("booking.html",
-                               club=club,
-                               competition=competition)
-
-
-def record_changes(competitions: list[dict[str, any]],
-                   competition: dict[str, any],
-                   clubs: list[dict[str, any]],
-                   club: dict[str, any],
-                   required_places: int,
-                   club_number_of_points: int,
-                   competition_path: str,
-                   club_path: str
-                   ) -> tuple[
-                    list[dict[str, any]], dict[str, any]]:
-    """Writes two new JSON files to record the changes after the club
-     successfully purchased places to the competition.
-
-     Helper function used in server.purchase_places.
+    checks = (
+        (more_than_12_reserved_places,
+         (club["reserved_places"][competition["name"]], required_places)),
+        (not_enough_points, (required_places, club_number_of_points)),
+        (no_more_available_places,
+         (required_places, competition["number_of_places"])),
+        (competition_took_place, (competition,)),
+    )
+    for check, args in checks:
+        message = check(*args)
+        if message:
+            return check.__name__, message
+
+
+def apply_booking(competitions: "RecordTable",
+                  competition: dict[str, any],
+                  clubs: "RecordTable",
+                  club: dict[str, any],
+                  required_places: int,
+                  club_number_of_points: int
+                  ) -> tuple[
+                    "RecordTable", "RecordTable", dict[str, any]]:
+    """Computes the new versions of the club and the competition after the
+    club successfully purchased places to the competition, without writing
+    them to the JSON files.
+
+    The club and the competition belong to a store.Snapshot that other
+    requests may be reading, so they are copied instead of being modified.
 
     Args:
-        competitions: all the competitions. Even if only one competition
-            was modified, we need to write them all back to the JSON.
+        competitions: all the competitions.
         competition: the competition where the club wants to purchase places
             within this operation.
-        clubs: all the competitions. Even if only one competition
-            was modified, we need to write them all back to the JSON.
+        clubs: all the clubs.
         club: the club trying to purchase places.
         required_places: the number of places the club wants to reserve at the
             tournament within this operation.
         club_number_of_points: the number of points the club has before this
             operation.
-        competition_path: path to the JSON file storing the competitions.
-        club_path: path to the JSON file storing the clubs.
 
-    Returns: All the competitions and the club that successfully purchased
-        the places. Those dictionaries are used by the render_template call
-        returned by server.purchase_places.
+    Returns: The new tables of competitions and clubs and the updated club.
     """
     competition_to_be_booked_name = competition["name"]
-    competition['number_of_places'] = int(
+    competition = dict(competition, number_of_places=int(
         competition['number_of_places']
-    ) - required_places
-
-    club["points"] = club_number_of_points - required_places
+    ) - required_places)
 
     reserved_places = club["reserved_places"][competition_to_be_booked_name]
     total_reserved_places = reserved_places + required_places
-    club["reserved_places"][
-        competition_to_be_booked_name] = total_reserved_places
-    with open(club_path, "w") as to_be_updated_clubs:
-        json.dump({"clubs": clubs},
-                  to_be_updated_clubs,
-                  indent=4)
-
-    with open(competition_path, "w") as to_be_updated_competitions:
-        json.dump({"competitions": competitions},
-                  to_be_updated_competitions,
-                  indent=4)
-
-    return competitions, club
+    club = dict(
+        club,
+        points=club_number_of_points - required_places,
+        reserved_places=dict(
+            club["reserved_places"],
+            **{competition_to_be_booked_name: total_reserved_places}
+        )
+    )
+
+    return competitions.replace(competition), clubs.replace(club), club
+
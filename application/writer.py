@@ -0,0 +1,173 @@
+"""The thread committing the bookings.
+
+The request handlers don't write the JSON files themselves anymore. They
+submit their booking to the BookingWriter and wait for its result. The writer
+takes the bookings waiting in its queue as a batch, checks and applies them in
+order, then writes the JSON files and publishes the new snapshot once for the
+whole batch. The cost of writing and syncing the files to the disk is shared
+by all the bookings of the batch.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import groupby
+from typing import NamedTuple, Optional
+
+from application import current_tenant
+from application.store import Snapshot
+from application.utils import apply_booking, first_failed_check, \
+    write_records
+
+
+class BookingIntent(NamedTuple):
+    tenant: str
+    competition_name: str
+    club_name: str
+    places: int
+    future: Future
+
+
+class BookingResult(NamedTuple):
+    """What a booking gives back to the request handler.
+
+    failed_check is the message of the first unmet condition, if any. club
+    and competition are their version after the booking, or the version that
+    was checked if it failed. snapshot and feed_version are those published
+    by the batch, or None if nothing was published.
+    """
+    failed_check: Optional[str]
+    club: dict[str, any]
+    competition: dict[str, any]
+    snapshot: Optional[Snapshot]
+    feed_version: Optional[int]
+
+
+class BookingWriter:
+    """Owns the changes made by the bookings.
+
+    Args:
+        registry: the tenants.TenantRegistry of the app.
+        analytics: the analytics.BookingAnalytics of the app, counting the
+            failed checks and the committed bookings.
+        max_batch: the maximum number of bookings committed together.
+        max_wait: the number of seconds the writer waits for more bookings
+            after the first one of a batch. With 0, a batch is made of the
+            bookings which came while the previous one was being written.
+    """
+
+    def __init__(self, registry, analytics, max_batch: int,
+                 max_wait: float):
+        self.registry = registry
+        self.analytics = analytics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, tenant: str, competition_name: str, club_name: str,
+               places: int) -> Future:
+        """Queues a booking. The future gives a BookingResult once the
+        booking is committed or refused."""
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="booking-writer", daemon=True
+                    )
+                    self._thread.start()
+        future = Future()
+        self._queue.put(BookingIntent(tenant, competition_name, club_name,
+                                      places, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            for tenant, intents in groupby(batch, key=lambda i: i.tenant):
+                intents = list(intents)
+                try:
+                    self._commit(tenant, intents)
+                except Exception as error:
+                    # The thread must survive, or every later booking would
+                    # wait forever.
+                    for intent in intents:
+                        if not intent.future.done():
+                            intent.future.set_exception(error)
+
+    def _next_batch(self) -> list[BookingIntent]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(
+                    timeout=max(0.0, deadline - time.monotonic())
+                ))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, tenant: str, intents: list[BookingIntent]) -> None:
+        """Checks and applies the bookings of a tenant in order, then writes
+        the accepted ones all at once. They are only counted by the analytics
+        once written."""
+        current_tenant.set(tenant)
+        accepted = []
+        refused = []
+        try:
+            with self.registry.writing(tenant) as store:
+                snapshot = store.snapshot()
+                competitions, clubs = snapshot.competitions, snapshot.clubs
+                for intent in intents:
+                    try:
+                        competition = competitions.get(
+                            "name", intent.competition_name
+                        )
+                        club = clubs.get("name", intent.club_name)
+                        club_number_of_points = int(club["points"])
+                        failed_check = first_failed_check(
+                            competition, club, intent.places,
+                            club_number_of_points
+                        )
+                        if failed_check:
+                            check_name, message = failed_check
+                            self.analytics.record_failed_check(check_name)
+                            refused.append((intent, message,
+                                            club, competition))
+                            continue
+                        competitions, clubs, club = apply_booking(
+                            competitions, competition, clubs, club,
+                            intent.places, club_number_of_points
+                        )
+                    except Exception as error:
+                        intent.future.set_exception(error)
+                        continue
+                    accepted.append((intent, club))
+
+                published, feed_version = None, None
+                if accepted:
+                    write_records(store.club_path, "clubs", clubs)
+                    write_records(store.competition_path, "competitions",
+                                  competitions)
+                    published = store.publish(clubs, competitions)
+                    feed_version = store.feed.version
+        except Exception as error:
+            for intent in intents:
+                if not intent.future.done():
+                    intent.future.set_exception(error)
+            return
+
+        for intent, club in accepted:
+            self.analytics.record_booking(intent.competition_name,
+                                          intent.places)
+            intent.future.set_result(BookingResult(
+                None, club,
+                published.competitions.get("name", intent.competition_name),
+                published, feed_version
+            ))
+        for intent, failed_check, club, competition in refused:
+            intent.future.set_result(BookingResult(
+                failed_check, club, competition, published, feed_version
+            ))
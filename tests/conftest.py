@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from application import create_app
+
+FUTURE_DATE = "2099-03-27 10:00:00"
+PAST_DATE = "2020-03-27 10:00:00"
+
+
+def write_data(path, key, records):
+    path.write_text(json.dumps({key: records}, indent=4))
+
+
+def read_data(path, key):
+    return json.loads(path.read_text())[key]
+
+
+def touch_later(path):
+    """Makes sure a change is seen even on file systems with a coarse
+    modification time."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def competitions():
+    return [
+        {"name": "Spring Festival", "date": FUTURE_DATE,
+         "number_of_places": 25, "taken_place": False},
+        {"name": "Fall Classic", "date": FUTURE_DATE,
+         "number_of_places": 13, "taken_place": False},
+    ]
+
+
+@pytest.fixture
+def clubs(competitions):
+    reserved_places = {competition["name"]: 0 for competition in competitions}
+    return [
+        {"name": "Simply Lift", "email": "john@simplylift.co",
+         "points": "13", "reserved_places": dict(reserved_places)},
+        {"name": "Iron Temple", "email": "admin@irontemple.com",
+         "points": "4", "reserved_places": dict(reserved_places)},
+        {"name": "She Lifts", "email": "kate@shelifts.co.uk",
+         "points": "12", "reserved_places": dict(reserved_places)},
+    ]
+
+
+@pytest.fixture
+def club_path(tmp_path, clubs):
+    path = tmp_path / "clubs.json"
+    write_data(path, "clubs", clubs)
+    return path
+
+
+@pytest.fixture
+def competition_path(tmp_path, competitions):
+    path = tmp_path / "competitions.json"
+    write_data(path, "competitions", competitions)
+    return path
+
+
+def make_app(club_path, competition_path, instance_path=None, **config):
+    return create_app(dict({
+        "TESTING": True,
+        "CLUB_PATH": str(club_path),
+        "COMPETITION_PATH": str(competition_path),
+        "TEMPLATE_BYTECODE_CACHE": False,
+    }, **config), instance_path=instance_path)
+
+
+@pytest.fixture
+def app(club_path, competition_path):
+    return make_app(club_path, competition_path, STREAM_TEMPLATES=False)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,139 @@
+import fcntl
+
+import pytest
+
+from application import allocation, utils
+from application.allocation import allocate_season_points
+from application.store import CLUB_FIELDS, COMPETITION_FIELDS, RecordTable, \
+    lock_path
+from tests.conftest import FUTURE_DATE, PAST_DATE, read_data
+
+
+def make_clubs(*clubs):
+    return RecordTable.from_records([
+        {"name": name, "email": f"{name}@example.com", "points": points,
+         "reserved_places": reserved_places}
+        for name, points, reserved_places in clubs
+    ], CLUB_FIELDS)
+
+
+def make_competitions(*competitions):
+    return RecordTable.from_records([
+        dict({"name": name, "date": date, "number_of_places": 20,
+              "taken_place": date == PAST_DATE}, **fields)
+        for name, date, fields in competitions
+    ], COMPETITION_FIELDS)
+
+
+@pytest.fixture
+def season_competitions():
+    return make_competitions(
+        ("Cancelled Cup", FUTURE_DATE, {"cancelled": True}),
+        ("Empty Open", PAST_DATE, {}),
+        ("Full Open", PAST_DATE, {}),
+        ("Next Open", FUTURE_DATE, {}),
+    )
+
+
+def test_points_are_capped_then_granted(season_competitions):
+    clubs = make_clubs(("rich", "13", {}), ("poor", "2", {}))
+
+    updated, refunded = allocate_season_points(
+        clubs, season_competitions, base_grant=12, carry_over_cap=6,
+        min_attendance=4
+    )
+
+    assert [club["points"] for club in updated] == [18, 14]
+    assert refunded == 0
+
+
+def test_no_cap_keeps_all_the_points(season_competitions):
+    clubs = make_clubs(("rich", "13", {}))
+
+    updated, _ = allocate_season_points(
+        clubs, season_competitions, base_grant=12, carry_over_cap=None,
+        min_attendance=4
+    )
+
+    assert updated[0]["points"] == 25
+
+
+def test_cancelled_and_under_attended_competitions_are_refunded(
+        season_competitions):
+    clubs = make_clubs(
+        ("a", "0", {"Cancelled Cup": 3, "Empty Open": 1, "Full Open": 2,
+                    "Next Open": 1}),
+        ("b", "0", {"Empty Open": 2, "Full Open": 3, "Next Open": 0}),
+        ("c", "0", {"Gone Cup": 5}),
+    )
+
+    updated, refunded = allocate_season_points(
+        clubs, season_competitions, base_grant=0, carry_over_cap=6,
+        min_attendance=4
+    )
+
+    assert [club["points"] for club in updated] == [4, 2, 0]
+    assert refunded == 6
+    assert updated[0]["reserved_places"] == {
+        "Cancelled Cup": 0, "Empty Open": 0, "Full Open": 2, "Next Open": 1
+    }
+    assert updated[1]["reserved_places"] == {
+        "Empty Open": 0, "Full Open": 3, "Next Open": 0
+    }
+    assert updated[2]["reserved_places"] == {"Gone Cup": 5}
+
+
+def test_refunds_are_not_given_twice(season_competitions):
+    clubs = make_clubs(("a", "0", {"Cancelled Cup": 3}))
+
+    updated, _ = allocate_season_points(
+        clubs, season_competitions, base_grant=0, carry_over_cap=None,
+        min_attendance=4
+    )
+    again, refunded = allocate_season_points(
+        RecordTable.from_records(updated, CLUB_FIELDS), season_competitions,
+        base_grant=0, carry_over_cap=None, min_attendance=4
+    )
+
+    assert again[0]["points"] == 3
+    assert refunded == 0
+
+
+def test_snapshot_of_the_clubs_is_not_modified(season_competitions):
+    clubs = make_clubs(("a", "5", {"Cancelled Cup": 3}))
+
+    allocate_season_points(clubs, season_competitions, base_grant=12,
+                           carry_over_cap=6, min_attendance=4)
+
+    club = clubs.get("name", "a")
+    assert club["points"] == "5"
+    assert club["reserved_places"] == {"Cancelled Cup": 3}
+
+
+def test_command_writes_the_points(app, club_path):
+    result = app.test_cli_runner().invoke(args=[
+        "allocate-points", "--base-grant", "10", "--carry-over-cap", "6"
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert [club["points"] for club in read_data(club_path, "clubs")] == \
+        [16, 14, 16]
+
+
+def test_command_holds_the_lock_of_the_bookings(app, club_path,
+                                                monkeypatch):
+    locked = []
+
+    def write_records(path, key, records):
+        with open(lock_path(path), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                locked.append(path)
+        utils.write_records(path, key, records)
+
+    monkeypatch.setattr(allocation, "write_records", write_records)
+    result = app.test_cli_runner().invoke(args=["allocate-points"])
+
+    assert result.exit_code == 0, result.output
+    assert locked == [str(club_path)]
@@ -0,0 +1,128 @@
+import contextvars
+
+import pytest
+
+from application import current_tenant
+from application.analytics import BUCKETS, BUCKET_SECONDS, \
+    BookingAnalytics, RingBuffer, bucket_count, percentile
+from tests.conftest import make_app
+
+SPAN = BUCKETS * BUCKET_SECONDS
+
+
+def test_ring_buffer_counts_by_bucket():
+    ring_buffer = RingBuffer()
+    ring_buffer.add(2, now=5)
+    ring_buffer.add(3, now=9)
+    ring_buffer.add(1, now=15)
+
+    assert ring_buffer.window(20, now=15) == [5, 1]
+    assert ring_buffer.window(10, now=15) == [1]
+    assert ring_buffer.window(30, now=25) == [5, 1, 0]
+
+
+def test_ring_buffer_reuses_a_slot_after_a_full_turn():
+    ring_buffer = RingBuffer()
+    ring_buffer.add(3, now=5)
+    ring_buffer.add(1, now=5 + SPAN)
+
+    assert ring_buffer.window(10, now=5 + SPAN) == [1]
+    assert sum(ring_buffer.window(SPAN, now=5 + SPAN)) == 1
+
+
+def test_ring_buffer_ignores_buckets_older_than_the_window():
+    ring_buffer = RingBuffer()
+    ring_buffer.add(4, now=5)
+
+    assert sum(ring_buffer.window(SPAN, now=5 + SPAN)) == 0
+    assert sum(ring_buffer.window(SPAN, now=5 + SPAN - BUCKET_SECONDS)) == 4
+
+
+@pytest.mark.parametrize("seconds, count", [
+    (-5, 1), (0, 1), (1, 1), (BUCKET_SECONDS, 1), (BUCKET_SECONDS + 1, 2),
+    (SPAN, BUCKETS), (SPAN * 10, BUCKETS),
+])
+def test_bucket_count_is_clamped(seconds, count):
+    assert bucket_count(seconds) == count
+
+
+@pytest.mark.parametrize("values, rank, expected", [
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 11)), 95, 10),
+    (list(range(10, 0, -1)), 0, 1),
+    ([7], 95, 7),
+])
+def test_percentile_is_nearest_rank(values, rank, expected):
+    assert percentile(values, rank) == expected
+
+
+def test_report_gives_the_rate_and_when_it_is_full():
+    analytics = BookingAnalytics()
+    analytics.record_booking("Spring Festival", 4, now=1000)
+    analytics.record_booking("Spring Festival", 2, now=1015)
+    analytics.record_failed_check("not_enough_points", now=1015)
+    analytics.record_failed_check("not_enough_points", now=1016)
+    analytics.record_failed_check("competition_took_place", now=1016)
+    competitions = [{"name": "Spring Festival", "number_of_places": "30"},
+                    {"name": "Fall Classic", "number_of_places": 13}]
+
+    report = analytics.report(competitions, 60, now=1019)
+
+    assert report["window_seconds"] == 60
+    assert report["competitions"] == {"Spring Festival": {
+        "places_sold": 6,
+        "places_per_minute": 6.0,
+        "p50_places_per_minute": 0.0,
+        "p95_places_per_minute": 24.0,
+        "seconds_until_full": 300.0,
+    }}
+    assert report["failed_checks"] == {
+        "not_enough_points": {"count": 2, "share": 2 / 3},
+        "competition_took_place": {"count": 1, "share": 1 / 3},
+    }
+
+
+def test_report_only_covers_the_current_tenant():
+    analytics = BookingAnalytics()
+
+    def record_for_north():
+        current_tenant.set("north")
+        analytics.record_booking("Spring Festival", 4, now=1000)
+
+    contextvars.copy_context().run(record_for_north)
+    competitions = [{"name": "Spring Festival", "number_of_places": 30}]
+
+    assert analytics.report(competitions, 60, now=1000)[
+        "competitions"] == {}
+
+
+def test_analytics_endpoint(client):
+    client.post("/purchasePlaces", data={"club": "Simply Lift",
+                                         "competition": "Spring Festival",
+                                         "places": "2"})
+    client.post("/purchasePlaces", data={"club": "Iron Temple",
+                                         "competition": "Spring Festival",
+                                         "places": "5"})
+
+    report = client.get("/analytics?window=60").json
+    assert report["window_seconds"] == 60
+    assert report["competitions"]["Spring Festival"]["places_sold"] == 2
+    assert report["failed_checks"] == {
+        "not_enough_points": {"count": 1, "share": 1.0}
+    }
+    assert client.get("/analytics").json["window_seconds"] == SPAN
+    assert client.get(f"/analytics?window={SPAN * 10}").json[
+        "window_seconds"] == SPAN
+
+
+def test_apps_have_their_own_analytics(client, app, club_path,
+                                       competition_path):
+    client.post("/purchasePlaces", data={"club": "Simply Lift",
+                                         "competition": "Spring Festival",
+                                         "places": "2"})
+    other_app = make_app(club_path, competition_path)
+
+    assert other_app.extensions["gudlft_analytics"] is not \
+        app.extensions["gudlft_analytics"]
+    assert other_app.test_client().get("/analytics").json[
+        "competitions"] == {}
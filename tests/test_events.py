@@ -0,0 +1,62 @@
+import json
+from itertools import islice
+
+from application import create_app
+from application.events import availability_events
+from tests.conftest import touch_later, write_data
+
+
+def test_live_availability_is_off_without_green_threads(client):
+    page = client.post("/showSummary", data={"email": "john@simplylift.co"})
+
+    assert b"EventSource" not in page.data
+    assert client.get("/availability").status_code == 404
+
+
+def test_live_availability_sends_the_state_of_the_competition(
+        club_path, competition_path):
+    app = create_app({
+        "TESTING": True,
+        "CLUB_PATH": str(club_path),
+        "COMPETITION_PATH": str(competition_path),
+        "TEMPLATE_BYTECODE_CACHE": False,
+        "LIVE_AVAILABILITY": True,
+    })
+    client = app.test_client()
+    page = client.post("/showSummary", data={"email": "john@simplylift.co"})
+    assert b"EventSource" in page.data
+
+    response = client.get("/availability?competition=Fall+Classic",
+                          buffered=False)
+    event = next(response.response)
+    response.close()
+
+    assert response.mimetype == "text/event-stream"
+    data = event.decode().split("data: ", 1)[1]
+    assert json.loads(data) == {"name": "Fall Classic",
+                                "number_of_places": 13,
+                                "taken_place": False}
+
+
+def next_event(events):
+    for message in islice(events, 100):
+        if message.startswith("id:"):
+            return json.loads(message.split("data: ", 1)[1])
+    return None
+
+
+def test_change_made_by_another_process_is_pushed(app, competition_path,
+                                                  competitions):
+    events = availability_events(
+        app.extensions["gudlft_tenants"], "default", {"Fall Classic"},
+        since=None, heartbeat_seconds=0.05, poll_seconds=0.01,
+        coalesce_seconds=0
+    )
+    assert next_event(events)["number_of_places"] == 13
+
+    competitions[1]["number_of_places"] = 4
+    write_data(competition_path, "competitions", competitions)
+    touch_later(competition_path)
+
+    assert next_event(events)["number_of_places"] == 4
+    events.close()
@@ -0,0 +1,93 @@
+"""Live availability served by gevent, the way the README deploys it."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import pytest
+
+pytest.importorskip("gevent")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONNECTIONS = 200
+SERVER = """
+import sys
+
+from gevent import monkey
+monkey.patch_all()
+
+from gevent.pywsgi import WSGIServer
+
+from application import create_app
+
+app = create_app({
+    "CLUB_PATH": sys.argv[1],
+    "COMPETITION_PATH": sys.argv[2],
+    "TEMPLATE_BYTECODE_CACHE": False,
+    "SSE_COALESCE_SECONDS": 0,
+})
+server = WSGIServer(("127.0.0.1", 0), app, log=None)
+server.start()
+print(server.server_port, flush=True)
+server.serve_forever()
+"""
+
+
+@pytest.fixture
+def server_port(club_path, competition_path):
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER, str(club_path), str(competition_path)],
+        cwd=ROOT, stdout=subprocess.PIPE
+    )
+    try:
+        yield int(server.stdout.readline())
+    finally:
+        server.kill()
+        server.wait()
+
+
+def open_stream(port):
+    stream = socket.create_connection(("127.0.0.1", port), timeout=10)
+    stream.sendall(b"GET /availability?competition=Spring+Festival "
+                   b"HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    return stream.makefile("rb")
+
+
+def next_event(stream):
+    for line in stream:
+        if line.startswith(b"data: "):
+            return json.loads(line[len(b"data: "):])
+    return None
+
+
+def request(port, path, data=None):
+    if data is not None:
+        data = urllib.parse.urlencode(data).encode()
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", data,
+                                timeout=10) as response:
+        return response.read().decode()
+
+
+def test_idle_streams_do_not_take_the_workers(server_port):
+    streams = [open_stream(server_port) for _ in range(CONNECTIONS)]
+    for stream in streams:
+        assert next_event(stream)["number_of_places"] == 25
+
+    started = time.monotonic()
+    page = request(server_port, "/showSummary",
+                   {"email": "john@simplylift.co"})
+    assert time.monotonic() - started < 2
+    assert "EventSource" in page
+
+    request(server_port, "/purchasePlaces", {
+        "club": "Simply Lift", "competition": "Spring Festival",
+        "places": "2"
+    })
+    for stream in streams:
+        assert next_event(stream)["number_of_places"] == 23
+        stream.close()
@@ -0,0 +1,44 @@
+import pytest
+
+from tests.conftest import make_app
+
+
+@pytest.fixture
+def streaming_client(club_path, competition_path):
+    return make_app(club_path, competition_path,
+                    STREAM_TEMPLATES=True).test_client()
+
+
+def test_points_page_is_streamed_whole(streaming_client):
+    response = streaming_client.get("/points")
+
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    for club in ("Simply Lift", "Iron Temple", "She Lifts"):
+        assert club in body
+    assert body.rstrip().endswith("</html>")
+
+
+def test_welcome_page_is_streamed_whole(streaming_client):
+    response = streaming_client.post("/showSummary",
+                                     data={"email": "john@simplylift.co"})
+
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    assert "Welcome, john@simplylift.co" in body
+    assert "Fall Classic" in body
+    assert body.rstrip().endswith("</html>")
+
+
+def test_flashed_message_is_shown_once(streaming_client):
+    response = streaming_client.post("/purchasePlaces", data={
+        "club": "Simply Lift", "competition": "Spring Festival",
+        "places": "2"
+    })
+
+    assert response.is_streamed
+    assert response.get_data(as_text=True).count(
+        "Great-booking complete!") == 1
+    assert "Great-booking complete!" not in streaming_client.get(
+        "/backToSummary/john@simplylift.co"
+    ).get_data(as_text=True)
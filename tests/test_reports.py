@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def booked_client(client):
+    for club, competition, places in (("Simply Lift", "Spring Festival", 2),
+                                      ("She Lifts", "Spring Festival", 3),
+                                      ("Iron Temple", "Fall Classic", 1)):
+        client.post("/purchasePlaces", data={"club": club,
+                                             "competition": competition,
+                                             "places": str(places)})
+    return client
+
+
+def test_roster_report_csv(booked_client):
+    response = booked_client.get("/reports/roster/Spring Festival")
+
+    assert response.mimetype == "text/csv"
+    assert response.get_data(as_text=True).splitlines() == [
+        "competition,club,places",
+        "Spring Festival,Simply Lift,2",
+        "Spring Festival,She Lifts,3",
+    ]
+
+
+def test_bookings_report_jsonl(booked_client):
+    response = booked_client.get("/reports/bookings?format=jsonl")
+
+    assert response.mimetype == "application/jsonl"
+    assert [json.loads(line) for line
+            in response.get_data(as_text=True).splitlines()] == [
+        {"competition": "Spring Festival", "club": "Simply Lift",
+         "places": 2},
+        {"competition": "Spring Festival", "club": "She Lifts",
+         "places": 3},
+        {"competition": "Fall Classic", "club": "Iron Temple", "places": 1},
+    ]
+
+
+def test_http_reports_never_give_the_emails(booked_client):
+    for path in ("/reports/bookings", "/reports/bookings?format=jsonl",
+                 "/reports/roster/Spring Festival?format=jsonl"):
+        assert "@" not in booked_client.get(path).get_data(as_text=True)
+
+
+@pytest.mark.parametrize("path", [
+    "/reports/roster/Unknown Cup",
+    "/reports/roster/Spring Festival?format=xml",
+    "/reports/bookings?format=xml",
+])
+def test_unknown_competition_or_format_is_not_found(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_roster_command_gives_the_emails(app, booked_client):
+    result = app.test_cli_runner().invoke(args=["roster",
+                                                "Spring Festival"])
+
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        "competition,club,email,places",
+        "Spring Festival,Simply Lift,john@simplylift.co,2",
+        "Spring Festival,She Lifts,kate@shelifts.co.uk,3",
+    ]
+
+
+def test_bookings_report_command_jsonl(app, booked_client):
+    result = app.test_cli_runner().invoke(args=["bookings-report",
+                                                "--format", "jsonl"])
+
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output.splitlines()[-1]) == {
+        "competition": "Fall Classic", "club": "Iron Temple",
+        "email": "admin@irontemple.com", "places": 1,
+    }
+
+
+@pytest.mark.parametrize("args", [
+    ["roster", "Unknown Cup"],
+    ["roster", "Spring Festival", "--format", "xml"],
+    ["bookings-report", "--tenant", "north"],
+])
+def test_commands_refuse_unknown_values(app, args):
+    result = app.test_cli_runner().invoke(args=args)
+
+    assert result.exit_code == 2
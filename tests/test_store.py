@@ -0,0 +1,153 @@
+import threading
+import time
+
+from application import utils, writer
+from application.store import CLUB_FIELDS, DataStore, RecordTable, \
+    build_rosters, update_rosters
+from tests.conftest import read_data, touch_later, write_data
+
+
+def test_snapshot_is_loaded_again_after_an_outside_change(club_path,
+                                                          competition_path,
+                                                          clubs):
+    store = DataStore(str(club_path), str(competition_path))
+    snapshot = store.snapshot()
+    assert store.snapshot() is snapshot
+
+    clubs[0]["points"] = 20
+    write_data(club_path, "clubs", clubs)
+    touch_later(club_path)
+
+    reloaded = store.snapshot()
+    assert reloaded.version == snapshot.version + 1
+    assert reloaded.clubs.get("name", "Simply Lift")["points"] == 20
+
+
+def test_publish_builds_on_an_outside_change(club_path, competition_path,
+                                             clubs):
+    store = DataStore(str(club_path), str(competition_path))
+    store.snapshot()
+    clubs[0]["points"] = 20
+    write_data(club_path, "clubs", clubs)
+    touch_later(club_path)
+
+    with store.writing():
+        snapshot = store.snapshot()
+        club = dict(snapshot.clubs.get("name", "Iron Temple"), points=1)
+        store.publish(snapshot.clubs.replace(club), snapshot.competitions)
+
+    assert store.snapshot().clubs.get("name", "Simply Lift")["points"] == 20
+    assert not store._files_changed()
+
+
+def test_outside_change_notifies_the_feed(club_path, competition_path,
+                                          competitions):
+    store = DataStore(str(club_path), str(competition_path))
+    store.snapshot()
+    competitions[1]["number_of_places"] = 3
+    write_data(competition_path, "competitions", competitions)
+    touch_later(competition_path)
+
+    version = store.feed.version
+    store.snapshot()
+    assert store.feed.changes_since(version) == ({"Fall Classic"},
+                                                 version + 1)
+
+
+def test_allocation_is_not_overwritten_by_a_booking(client, club_path,
+                                                    clubs):
+    client.get("/points")
+    clubs[0]["points"] = 20
+    write_data(club_path, "clubs", clubs)
+    touch_later(club_path)
+
+    client.post("/purchasePlaces", data={"club": "Simply Lift",
+                                         "competition": "Spring Festival",
+                                         "places": "2"})
+
+    points = {club["name"]: club["points"]
+              for club in read_data(club_path, "clubs")}
+    assert points == {"Simply Lift": 18, "Iron Temple": "4",
+                      "She Lifts": "12"}
+
+
+def roster_clubs(*reserved_places):
+    return RecordTable.from_records([
+        {"name": f"Club {number}", "email": f"club{number}@example.com",
+         "points": "12", "reserved_places": places}
+        for number, places in enumerate(reserved_places)
+    ], CLUB_FIELDS)
+
+
+def test_build_rosters_skips_empty_reservations():
+    clubs = roster_clubs({"Open": 2, "Cup": 0}, {"Open": 1})
+
+    assert build_rosters(clubs) == {"Open": {"Club 0": 2, "Club 1": 1}}
+
+
+def test_update_rosters_follows_the_changed_clubs():
+    clubs = roster_clubs({"Open": 2, "Cup": 0}, {"Open": 1}, {"Cup": 4})
+    rosters = build_rosters(clubs)
+    club_0 = dict(clubs.get("name", "Club 0"),
+                  reserved_places={"Open": 0, "Cup": 3})
+    club_1 = dict(clubs.get("name", "Club 1"),
+                  reserved_places={"Open": 1, "Final": 5})
+    new_clubs = clubs.replace(club_0, club_1)
+
+    new_rosters = update_rosters(rosters, new_clubs, clubs)
+
+    assert new_rosters == build_rosters(new_clubs)
+    assert new_rosters == {"Open": {"Club 1": 1},
+                           "Cup": {"Club 0": 3, "Club 2": 4},
+                           "Final": {"Club 1": 5}}
+    assert rosters == {"Open": {"Club 0": 2, "Club 1": 1},
+                       "Cup": {"Club 2": 4}}
+
+
+def test_update_rosters_shares_the_unchanged_rosters():
+    clubs = roster_clubs({"Open": 2}, {"Cup": 4})
+    rosters = build_rosters(clubs)
+    new_clubs = clubs.replace(dict(clubs.get("name", "Club 0"),
+                                   reserved_places={"Open": 3}))
+
+    new_rosters = update_rosters(rosters, new_clubs, clubs)
+
+    assert new_rosters["Cup"] is rosters["Cup"]
+    assert new_rosters["Open"] == {"Club 0": 3}
+    assert update_rosters(new_rosters, new_clubs, new_clubs) is new_rosters
+
+
+def test_update_rosters_of_a_rebuilt_table():
+    clubs = roster_clubs({"Open": 2}, {"Open": 1})
+    rosters = build_rosters(clubs)
+    new_clubs = roster_clubs({"Open": 0}, {"Open": 1})
+
+    assert update_rosters(rosters, new_clubs, clubs) == {
+        "Open": {"Club 1": 1}
+    }
+
+
+def test_readers_do_not_wait_on_a_slow_commit(app, club_path, monkeypatch):
+    store = app.extensions["gudlft_tenants"].store("default")
+    before = store.snapshot()
+    second_write_started = threading.Event()
+
+    def slow_write_records(path, key, records):
+        utils.write_records(path, key, records)
+        if key == "clubs":
+            second_write_started.set()
+            time.sleep(1)
+
+    monkeypatch.setattr(writer, "write_records", slow_write_records)
+    future = app.extensions["gudlft_writer"].submit(
+        "default", "Spring Festival", "Simply Lift", 2
+    )
+    assert second_write_started.wait(5)
+
+    started = time.monotonic()
+    during = store.snapshot()
+    assert time.monotonic() - started < 0.5
+    assert during is before
+
+    future.result(timeout=5)
+    assert store.snapshot().clubs.get("name", "Simply Lift")["points"] == 11
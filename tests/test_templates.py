@@ -0,0 +1,67 @@
+import html
+import os
+import re
+
+from flask import url_for
+
+from tests.conftest import FUTURE_DATE, make_app, write_data
+
+
+def test_compiled_templates_are_cached_in_the_instance_folder(
+        tmp_path, club_path, competition_path, monkeypatch):
+    instance_path = tmp_path / "instance"
+    first_app = make_app(club_path, competition_path,
+                         instance_path=str(instance_path),
+                         TEMPLATE_BYTECODE_CACHE=True)
+    assert first_app.test_client().get("/points").status_code == 200
+    cache_path = instance_path / "jinja_cache"
+    assert any(name.endswith(".cache") for name in os.listdir(cache_path))
+
+    second_app = make_app(club_path, competition_path,
+                          instance_path=str(instance_path),
+                          TEMPLATE_BYTECODE_CACHE=True)
+
+    def compile_template(*args, **kwargs):
+        raise AssertionError("the template should come from the cache")
+
+    monkeypatch.setattr(second_app.jinja_env, "compile", compile_template)
+    response = second_app.test_client().get("/points")
+    assert response.status_code == 200
+    assert "Simply Lift" in response.get_data(as_text=True)
+
+
+def test_booking_links_are_those_of_url_for(tmp_path, club_path,
+                                            competition_path):
+    north_clubs = tmp_path / "north_clubs.json"
+    north_competitions = tmp_path / "north_competitions.json"
+    competition_names = ["Spring & Summer Open: 100%", "Cup of Café",
+                         "Plain Open"]
+    club_name = "Lift Club #1 (Paris)"
+    write_data(north_clubs, "clubs", [
+        {"name": club_name, "email": "lift@example.com", "points": "12",
+         "reserved_places": {name: 0 for name in competition_names}},
+    ])
+    write_data(north_competitions, "competitions", [
+        {"name": name, "date": FUTURE_DATE, "number_of_places": 10,
+         "taken_place": False}
+        for name in competition_names
+    ])
+    app = make_app(
+        club_path, competition_path,
+        TENANTS={"north": {"CLUB_PATH": str(north_clubs),
+                           "COMPETITION_PATH": str(north_competitions)}}
+    )
+
+    page = app.test_client().post("/north/showSummary",
+                                  data={"email": "lift@example.com"})
+    links = [html.unescape(link) for link in re.findall(
+        r'<a class="booking" href="([^"]+)"', page.get_data(as_text=True)
+    )]
+
+    with app.test_request_context(base_url="http://localhost/north"):
+        expected = [url_for("gudlft.book",
+                            competition_to_be_booked_name=name,
+                            club_making_reservation_name=club_name)
+                    for name in competition_names]
+    assert links == expected
+    assert all(link.startswith("/north/book/") for link in links)
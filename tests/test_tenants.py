@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from application.tenants import RESIDENCY_FACTOR, TenantRegistry
+from application.utils import write_records
+from tests.conftest import make_app, write_data
+
+
+@pytest.mark.parametrize("tenant", ["book", "points", "reports",
+                                    "availability", "static", "default"])
+def test_tenant_named_like_a_route_is_rejected(club_path, competition_path,
+                                               tenant):
+    paths = {"CLUB_PATH": str(club_path),
+             "COMPETITION_PATH": str(competition_path)}
+    with pytest.raises(ValueError, match="reserved"):
+        make_app(club_path, competition_path, TENANTS={tenant: paths})
+
+
+def test_host_of_an_unknown_tenant_is_rejected(club_path, competition_path):
+    with pytest.raises(ValueError, match="unknown tenant"):
+        make_app(club_path, competition_path,
+                 TENANT_HOSTS={"north.example.com": "north"})
+
+
+def test_tenant_is_found_by_host_and_path(club_path, competition_path,
+                                          tmp_path):
+    north_clubs = tmp_path / "north_clubs.json"
+    north_clubs.write_text('{"clubs": [{"name": "North Club", '
+                           '"email": "north@example.com", "points": "3", '
+                           '"reserved_places": {}}]}')
+    app = make_app(
+        club_path, competition_path,
+        TENANTS={"north": {"CLUB_PATH": str(north_clubs),
+                           "COMPETITION_PATH": str(competition_path)}},
+        TENANT_HOSTS={"north.example.com": "north"}
+    )
+    client = app.test_client()
+
+    assert b"North Club" in client.get("/north/points").data
+    assert b"North Club" in client.get(
+        "/points", headers={"Host": "north.example.com"}
+    ).data
+    assert b"North Club" not in client.get("/points").data
+
+
+@pytest.fixture
+def league_paths(tmp_path, clubs, competitions):
+    """Three leagues whose files have the same size."""
+    paths = {}
+    for league in ("east", "north", "west"):
+        club_path = tmp_path / f"{league}_clubs.json"
+        competition_path = tmp_path / f"{league}_competitions.json"
+        write_data(club_path, "clubs", clubs)
+        write_data(competition_path, "competitions", competitions)
+        paths[league] = {"CLUB_PATH": str(club_path),
+                         "COMPETITION_PATH": str(competition_path)}
+    return paths
+
+
+def league_size(paths):
+    return RESIDENCY_FACTOR * (os.path.getsize(paths["CLUB_PATH"])
+                               + os.path.getsize(paths["COMPETITION_PATH"]))
+
+
+def test_least_recently_used_tenant_is_dropped(league_paths):
+    registry = TenantRegistry(league_paths,
+                              2 * league_size(league_paths["east"]))
+    east = registry.store("east")
+    north = registry.store("north")
+    assert registry.store("east") is east
+
+    west = registry.store("west")
+
+    assert north.retired
+    assert not east.retired and not west.retired
+    assert registry.store("east") is east
+    assert registry.store("west") is west
+
+
+def test_dropped_tenant_is_loaded_again_with_its_changes(league_paths):
+    registry = TenantRegistry(league_paths,
+                              league_size(league_paths["east"]))
+    with registry.writing("east") as store:
+        snapshot = store.snapshot()
+        club = dict(snapshot.clubs.get("name", "Simply Lift"), points=1)
+        clubs = snapshot.clubs.replace(club)
+        write_records(store.club_path, "clubs", clubs)
+        store.publish(clubs, snapshot.competitions)
+
+    registry.store("north")
+    assert store.retired
+
+    reloaded = registry.store("east")
+    assert reloaded is not store
+    assert reloaded.snapshot().clubs.get("name", "Simply Lift")["points"] \
+        == 1
+    assert registry.feed("east") is store.feed
+
+
+def test_tenant_over_the_budget_on_its_own_is_kept(league_paths):
+    registry = TenantRegistry(league_paths, 1)
+    east = registry.store("east")
+    assert registry.store("east") is east
+
+    north = registry.store("north")
+
+    assert east.retired
+    assert not north.retired
+    assert registry.store("north") is north
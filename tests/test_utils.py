@@ -0,0 +1,14 @@
+from application.utils import write_records
+from tests.conftest import read_data
+
+
+def test_write_records_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "clubs.json"
+    path.write_text("{}")
+    path.chmod(0o644)
+
+    write_records(str(path), "clubs", [{"name": "Simply Lift"}])
+
+    assert read_data(path, "clubs") == [{"name": "Simply Lift"}]
+    assert oct(path.stat().st_mode & 0o777) == oct(0o644)
+    assert [entry.name for entry in tmp_path.iterdir()] == ["clubs.json"]
@@ -0,0 +1,189 @@
+import fcntl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from application import DEFAULT_TENANT, utils, writer
+from application.analytics import BookingAnalytics
+from application.store import lock_path
+from application.tenants import TenantRegistry
+from tests.conftest import FUTURE_DATE, read_data, write_data
+
+
+def book(client, club, competition, places):
+    return client.post("/purchasePlaces", data={"club": club,
+                                                "competition": competition,
+                                                "places": str(places)})
+
+
+def test_failed_write_is_not_counted_as_sold(client, club_path,
+                                             monkeypatch):
+    def write_records(path, key, records):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(writer, "write_records", write_records)
+    with pytest.raises(OSError):
+        book(client, "Simply Lift", "Spring Festival", 2)
+
+    assert client.get("/analytics").json["competitions"] == {}
+    assert read_data(club_path, "clubs")[0]["points"] == "13"
+
+
+def test_written_booking_is_counted_as_sold(client):
+    book(client, "Simply Lift", "Spring Festival", 2)
+
+    report = client.get("/analytics").json["competitions"]
+    assert report["Spring Festival"]["places_sold"] == 2
+
+
+def test_writer_survives_an_unexpected_error(client, app, monkeypatch):
+    booking_writer = app.extensions["gudlft_writer"]
+    commit = booking_writer._commit
+    monkeypatch.setattr(booking_writer, "_commit",
+                        lambda tenant, intents: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        booking_writer.submit("default", "Spring Festival", "Simply Lift",
+                              1).result(timeout=5)
+
+    monkeypatch.setattr(booking_writer, "_commit", commit)
+    result = booking_writer.submit("default", "Spring Festival",
+                                   "Simply Lift", 1).result(timeout=5)
+    assert result.failed_check is None
+    assert booking_writer._thread.is_alive()
+
+
+def test_slow_writer_gives_an_error_page(client, app, monkeypatch):
+    app.config["WRITER_RESULT_TIMEOUT"] = 0.01
+    booking_writer = app.extensions["gudlft_writer"]
+    commit = booking_writer._commit
+
+    def slow_commit(tenant, intents):
+        time.sleep(0.2)
+        commit(tenant, intents)
+
+    monkeypatch.setattr(booking_writer, "_commit", slow_commit)
+
+    assert book(client, "Simply Lift", "Spring Festival", 1).status_code \
+        == 503
+
+
+@pytest.fixture
+def registry(club_path, competition_path):
+    return TenantRegistry.from_config({
+        "TENANTS": {},
+        "TENANT_HOSTS": {},
+        "CLUB_PATH": str(club_path),
+        "COMPETITION_PATH": str(competition_path),
+        "TENANT_MEMORY_BUDGET": 256 * 1024 * 1024,
+    })
+
+
+@pytest.fixture
+def counted_writes(monkeypatch):
+    """Counts the writes of the clubs' JSON file."""
+    writes = []
+
+    def write_records(path, key, records):
+        if key == "clubs":
+            writes.append(path)
+        utils.write_records(path, key, records)
+
+    monkeypatch.setattr(writer, "write_records", write_records)
+    return writes
+
+
+def test_bookings_of_a_batch_are_applied_in_order(registry, counted_writes,
+                                                  competition_path):
+    booking_writer = writer.BookingWriter(registry, BookingAnalytics(),
+                                          max_batch=64, max_wait=0.0)
+    with registry.writing(DEFAULT_TENANT):
+        first = booking_writer.submit(DEFAULT_TENANT, "Fall Classic",
+                                      "Simply Lift", 10)
+        second = booking_writer.submit(DEFAULT_TENANT, "Fall Classic",
+                                       "She Lifts", 5)
+        third = booking_writer.submit(DEFAULT_TENANT, "Fall Classic",
+                                      "Iron Temple", 3)
+
+    assert first.result(timeout=5).failed_check is None
+    assert second.result(timeout=5).failed_check == \
+        "there are no more places available !"
+    third_result = third.result(timeout=5)
+    assert third_result.failed_check is None
+    assert third_result.competition["number_of_places"] == 0
+    assert len(counted_writes) <= 2
+    assert read_data(competition_path, "competitions")[1][
+        "number_of_places"] == 0
+
+
+def test_bookings_waiting_together_are_written_once(registry,
+                                                    counted_writes):
+    booking_writer = writer.BookingWriter(registry, BookingAnalytics(),
+                                          max_batch=64, max_wait=0.0)
+    with registry.writing(DEFAULT_TENANT):
+        # The writer takes the first booking and waits for the lock; the
+        # others pile up in the queue and make the next batch.
+        booking_writer.submit(DEFAULT_TENANT, "Spring Festival",
+                              "Simply Lift", 1)
+        time.sleep(0.05)
+        futures = [booking_writer.submit(DEFAULT_TENANT, "Spring Festival",
+                                         "Simply Lift", 1)
+                   for _ in range(5)]
+
+    results = [future.result(timeout=5) for future in futures]
+    assert all(result.failed_check is None for result in results)
+    assert len(counted_writes) == 2
+    assert results[-1].club["points"] == 7
+
+
+def test_concurrent_bookings_never_oversell(tmp_path):
+    club_path = tmp_path / "clubs.json"
+    competition_path = tmp_path / "competitions.json"
+    write_data(club_path, "clubs", [
+        {"name": f"Club {number}", "email": f"club{number}@example.com",
+         "points": "12", "reserved_places": {"Fall Classic": 0}}
+        for number in range(30)
+    ])
+    write_data(competition_path, "competitions", [
+        {"name": "Fall Classic", "date": FUTURE_DATE,
+         "number_of_places": 13, "taken_place": False},
+    ])
+    registry = TenantRegistry.from_config({
+        "TENANTS": {},
+        "TENANT_HOSTS": {},
+        "CLUB_PATH": str(club_path),
+        "COMPETITION_PATH": str(competition_path),
+        "TENANT_MEMORY_BUDGET": 256 * 1024 * 1024,
+    })
+    booking_writer = writer.BookingWriter(registry, BookingAnalytics(),
+                                          max_batch=8, max_wait=0.001)
+
+    def book_one(number):
+        return booking_writer.submit(DEFAULT_TENANT, "Fall Classic",
+                                     f"Club {number}", 1).result(timeout=10)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(book_one, range(30)))
+
+    assert sum(result.failed_check is None for result in results) == 13
+    assert read_data(competition_path, "competitions")[0][
+        "number_of_places"] == 0
+    assert sum(club["reserved_places"]["Fall Classic"]
+               for club in read_data(club_path, "clubs")) == 13
+
+
+def test_booking_waits_for_a_writer_of_another_process(registry,
+                                                       club_path):
+    booking_writer = writer.BookingWriter(registry, BookingAnalytics(),
+                                          max_batch=64, max_wait=0.0)
+    # A lock taken on another open file of the lock file conflicts with
+    # the writer's like the lock of another process would.
+    with open(lock_path(str(club_path)), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        future = booking_writer.submit(DEFAULT_TENANT, "Spring Festival",
+                                       "Simply Lift", 1)
+        time.sleep(0.2)
+        assert not future.done()
+
+    assert future.result(timeout=5).failed_check is None